@@ -0,0 +1,221 @@
+import os
+import stat
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+class BlobStore:
+    """
+    Content addressed store of files for the job directories.  Each distinct file content is stored once as a read
+    only blob named by its sha256 hash.  Files the jobs never write are staged by hard linking their blob, so staging
+    the same model files into many jobs costs neither time nor disk space.  A hard linked file shares its inode with
+    every other job, it must be replaced rather than changed in place (see unshare).
+
+    All other files are reflinked from the source where the file system supports it, which shares the disk blocks
+    until either file is written, or copied otherwise.  They are private to the job and keep the permissions of the
+    source.
+    """
+
+    k_hash_block_size = 1024 * 1024
+    k_ficlone = 0x40049409  # Linux FICLONE ioctl request number
+
+    def __init__(self, store_root):
+        """
+        :param store_root: directory of the blobs, created if it does not exist
+        """
+        self.__root = store_root
+        self.__lock = threading.Lock()
+        self.__link_lock = threading.Lock()  # Keeps prune from removing a blob between adding and linking it
+        self.__hash_cache = {}  # Content hash of each source file by (device, inode, size, modification time)
+        self.__can_reflink = fcntl is not None
+
+        # Windows keeps the read only attribute on the inode, a read only hard link could not be removed without
+        # making the blob and all the other links writable
+        self.__can_link = os.name != 'nt'
+        self.files_linked = 0
+        self.files_reflinked = 0
+        self.files_copied = 0
+        self.bytes_staged = 0
+        self.bytes_saved = 0
+        os.makedirs(store_root, exist_ok=True)
+
+    @property
+    def store_root(self):
+        return self.__root
+
+    def report(self):
+        """
+        :return: dictionary of the number of files linked, reflinked and copied and of the bytes staged and saved
+         by not copying them
+        """
+        return {
+            'files_linked': self.files_linked,
+            'files_reflinked': self.files_reflinked,
+            'files_copied': self.files_copied,
+            'bytes_staged': self.bytes_staged,
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def blob_path(self, digest):
+        return os.path.join(self.__root, digest[:2], digest[2:])
+
+    def file_hash(self, file_path):
+        """
+        Returns the sha256 hash of the file content, hashes are cached until the file changes
+        :param file_path:
+        :return: hex digest
+        """
+        st = os.stat(file_path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.__lock:
+            digest = self.__hash_cache.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.k_hash_block_size), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self.__lock:
+                self.__hash_cache[key] = digest
+        return digest
+
+    def add_file(self, file_path):
+        """
+        Adds the content of the file to the store, if not already stored
+        :param file_path:
+        :return: path of the blob
+        """
+        blob = self.blob_path(self.file_hash(file_path))
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+            # Copy next to the blob and rename so a blob is never seen partially written
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob))
+            os.close(fd)
+            try:
+                shutil.copy2(file_path, tmp_path)
+                os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(tmp_path, blob)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return blob
+
+    def stage_file(self, src_path, dst_path, read_only=False):
+        """
+        Places the content of the source file at the destination path, by hard linking its blob if the file is read
+        only, otherwise by reflinking the source or copying it if that is not possible
+        :param src_path: source file
+        :param dst_path: destination file, must not exist
+        :param read_only: the job never writes the file, so it may share the inode of the blob with other jobs
+        :return: number of bytes saved by not copying the file
+        """
+        size = os.path.getsize(src_path)
+        linked = False
+        if read_only and self.__can_link:
+            with self.__link_lock:
+                blob = self.add_file(src_path)
+                try:
+                    os.link(blob, dst_path)
+                    linked = True
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EACCES, errno.ENOTSUP):
+                        raise
+        if linked:
+            self.files_linked += 1
+            saved = size
+        elif self.__reflink(src_path, dst_path):
+            self.files_reflinked += 1
+            saved = size
+        else:
+            shutil.copy2(src_path, dst_path)
+            self.files_copied += 1
+            saved = 0
+        self.bytes_staged += size
+        self.bytes_saved += saved
+        return saved
+
+    def __reflink(self, src_path, dst_path):
+        if not self.__can_reflink:
+            return False
+        try:
+            with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), self.k_ficlone, src.fileno())
+            shutil.copystat(src_path, dst_path)
+            return True
+        except OSError as e:
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+
+            # Do not retry on a file system without reflink support, other errors (e.g. a source on another file
+            # system) only concern this file
+            if e.errno in (errno.EOPNOTSUPP, errno.EINVAL):
+                self.__can_reflink = False
+            return False
+
+    def stage_tree(self, src, dst, symlinks=False, read_only=False):
+        """
+        Stages all the files of the source directory into the destination directory, keeping the directory structure
+        :param src: source directory
+        :param dst: destination directory, created if it does not exist
+        :param symlinks: recreate symbolic links instead of staging the files they point to
+        :param read_only: the job never writes the files (see stage_file), either a bool for all the files or a
+         function of the source file path returning a bool
+        :return: number of bytes saved by not copying the files
+        """
+        saved = 0
+        os.makedirs(dst, exist_ok=True)
+        for entry in os.scandir(src):
+            dst_path = os.path.join(dst, entry.name)
+            if symlinks and entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dst_path)
+            elif entry.is_dir():
+                saved += self.stage_tree(entry.path, dst_path, symlinks, read_only)
+            else:
+                file_read_only = read_only(entry.path) if callable(read_only) else read_only
+                saved += self.stage_file(entry.path, dst_path, file_read_only)
+        return saved
+
+    @staticmethod
+    def unshare(file_path):
+        """
+        Replaces a staged file by a private writable copy so it can be changed in place
+        :param file_path: staged file
+        :return: nothing
+        """
+        tmp_path = file_path + '.unshare'
+        shutil.copy2(file_path, tmp_path)
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(tmp_path).st_mode) | stat.S_IWUSR)
+        os.replace(tmp_path, file_path)
+
+    def prune(self):
+        """
+        Removes the blobs no longer hard linked into any job directory
+        :return: number of bytes freed
+        """
+        with self.__link_lock:
+            return self.__prune()
+
+    def __prune(self):
+        freed = 0
+        for dir_entry in os.scandir(self.__root):
+            if not dir_entry.is_dir():
+                continue
+            for entry in os.scandir(dir_entry.path):
+                st = os.stat(entry.path)  # DirEntry.stat() does not report the link count on Windows
+                if st.st_nlink <= 1:
+                    try:
+                        os.remove(entry.path)
+                        freed += st.st_size
+                    except OSError:
+                        logging.exception(' Could not remove blob {0}'.format(entry.path))
+        return freed
@@ -1,5 +1,19 @@
+import io
+import os
 import re
-from jinja2 import Template
+import mmap
+import codecs
+import locale
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict, ChainMap
+from collections.abc import Mapping
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import jinja2
+from jinja2 import Environment, FileSystemBytecodeCache, nodes
+from jinja2.exceptions import TemplateSyntaxError
 
 
 class ConstrainedText:
@@ -12,9 +26,36 @@ class ConstrainedText:
     k_tag_map = "{@ MAPPED @}"
     re_jin_exp = re.compile(r'{{\s[a-zA-Z_][a-zA-Z0-9_]*\s}}') 
 
+    # Line tag codes of rendered text records
+    k_line_none = 0
+    k_line_rw = 1
+    k_line_ro = 2
+    k_line_map = 3
+
+    # Jinja options used when compiling and rendering templates
+    k_render_opts = {'trim_blocks': True, 'lstrip_blocks': True}
+
+    # Size in bytes of the pieces of a memory mapped template file decoded at a time
+    k_mmap_chunk_size = 1024 * 1024
+
+    # Process wide cache of compiled templates keyed by template hash and render options
+    template_cache_size = 64
+    template_cache_hits = 0
+    template_cache_misses = 0
+    _template_cache = OrderedDict()
+    _template_envs = {}
+    _template_cache_lock = threading.Lock()
+
+    # Optional on disk cache of compiled template bytecode shared between sessions
+    k_bytecode_cache_pattern = '__acescliui_jinja2_{0:s}_%s.cache'.format(jinja2.__version__)
+    _bytecode_cache = None
+
     def __init__(self):
         self._jin_cntxt = {}
         self._template_text = ""
+        self._template_hash = None
+        self._render_index = None  # Per line chunk render state used by update_mapped_values
+        self._template_refs = None  # Variables and subscript keys referenced by the template
         self._has_data = False
         self._has_template = False
 
@@ -36,6 +77,7 @@ class ConstrainedText:
         :return: None
         """
         self._jin_cntxt.clear()
+        self._invalidate_rendered_chunks()
         self._has_data = True
 
     def get_mapped_data(self, mapped_data):
@@ -81,35 +123,219 @@ class ConstrainedText:
                 # if isinstance(new_v, str):
                 #     new_v = re.sub(r'\n', self.k_tag_map+r'\n ', new_v)
                 self._jin_cntxt[k] = new_v
+        self._invalidate_rendered_chunks()
         self._has_data = True
 
-    def get_template_from_file(self, template_path):
-        with open(template_path, "rt") as fin:
-            template_lines = fin.readlines()
-        self._process_template(template_lines)
+    def update_mapped_values(self, changes):
+        """
+        Changes individual values of the mapped data and re-renders only the lines of the template that
+        reference the changed values.  On the first call the template is split into independently renderable
+        chunks of lines and each chunk is rendered once with the current data, after that only the chunks
+        depending on a changed value (or on the changed keys of a dictionary value) are rendered again.
+        Dictionary values should be given as new objects rather than being modified in place.
+        :param changes: dictionary of context names (the parameter names used by get_mapped_data) and new values
+        :return: list of (first_line, old_line_count, new_lines) tuples sorted by first_line.  Each tuple replaces
+         old_line_count lines of the previously rendered text (as returned by render_textlines) starting at
+         first_line with the list of new_lines.  Returns None if the text cannot be rendered.
+        """
+        if not self.can_render():
+            return None
+        if self._render_index is None:
+            opts_key = tuple(sorted(self.k_render_opts.items()))
+            self._render_index = _RenderIndex(self._get_environment(opts_key), self._template_text,
+                                              self._get_template(), self._jin_cntxt)
+        return self._render_index.update(changes)
+
+    def _invalidate_rendered_chunks(self):
+        if self._render_index is not None:
+            self._render_index.outputs = None
+
+    def get_template_from_file(self, template_path, use_mmap=False, encoding=None):
+        """
+        Reads the template from a file in a single streaming pass.
+        :param template_path: path to the jinja template file
+        :param use_mmap: memory map the file instead of reading it through a text buffer.  The template text is the
+         same either way, reading through the text buffer is usually faster.
+        :param encoding: text encoding of the file, defaults to the locale preferred encoding
+        :return: None
+        """
+        if use_mmap and os.path.getsize(template_path) > 0:
+            with open(template_path, "rb") as fin:
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    self._process_template(self._iter_mmap_lines(mm, encoding))
+        else:
+            with open(template_path, "rt", encoding=encoding) as fin:
+                self._process_template(fin)
+
+    def get_template_from_fileobj(self, template_fileobj):
+        """
+        Reads the template from an open text file object or any other iterable of lines (with line endings)
+        without first loading the whole template into memory.
+        :param template_fileobj: text file object or iterable of template lines
+        :return: None
+        """
+        self._process_template(template_fileobj)
 
     def get_template_from_string(self, template_string):
-        template_lines = template_string.split("\n")
-        for i in range(len(template_lines)):
-            template_lines[i] += "\n"
-        self._process_template(template_lines)
+        self._process_template(self._iter_string_lines(template_string))
+
+    @staticmethod
+    def _iter_string_lines(template_string):
+        """
+        Yields the lines of the template string each terminated by a line ending, this includes the last line
+        even when the string already ends with a line ending (same as splitting on line endings and appending one).
+        """
+        prev_line = None
+        for line in io.StringIO(template_string):
+            if prev_line is not None:
+                yield prev_line
+            prev_line = line
+        if prev_line is None:
+            yield "\n"
+        elif prev_line.endswith("\n"):
+            yield prev_line
+            yield "\n"
+        else:
+            yield prev_line + "\n"
+
+    @classmethod
+    def _iter_mmap_lines(cls, mm, encoding=None):
+        """
+        Yields decoded lines from a memory mapped file, decoding and translating the line endings like a text mode
+        file.  The file is decoded in chunks so encodings with multi-byte line endings (e.g. UTF-16) are supported.
+        """
+        encoding = encoding or locale.getpreferredencoding(False)
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+        tail = ""
+        for start in range(0, len(mm), cls.k_mmap_chunk_size):
+            lines = (tail + decoder.decode(mm[start:start + cls.k_mmap_chunk_size])).split("\n")
+            tail = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        lines = (tail + decoder.decode(b"", final=True)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        if tail:
+            yield tail
 
     def _process_template(self, template_lines):
         """
         Originally this method would find any lines containing Jinja variable namings and then add
         an identifier at the end to mark the line as mapped, but this is no longer used so this method
-        is kind of no longer necessary (right now it really does nothing)
-        :param template_lines: 
+        is kind of no longer necessary (right now it really does nothing).  The lines are consumed in a single
+        pass so any iterable of lines (file object, generator, list) can be given.
+        :param template_lines: iterable of template lines
         :return: 
         """
-        self._template_text = ""
+        text_parts = []
         for line in template_lines:
             if self.re_jin_exp.search(line):
-                self._template_text = "{0:s}{1:s} {2:s}\n".format(self._template_text, line.rstrip('\n'), '')
+                text_parts.append("{0:s} {1:s}\n".format(line.rstrip('\n'), ''))
             else:
-                self._template_text = "{0:s}{1:s}".format(self._template_text, line)
+                text_parts.append(line)
+        self._template_text = "".join(text_parts)
+        self._template_hash = None
+        self._render_index = None
+        self._template_refs = None
         self._has_template = True
 
+    @classmethod
+    def clear_template_cache(cls):
+        """
+        Removes all compiled templates from the process wide template cache and resets the hit/miss counters
+        :return: None
+        """
+        with cls._template_cache_lock:
+            cls._template_cache.clear()
+            cls.template_cache_hits = 0
+            cls.template_cache_misses = 0
+
+    @classmethod
+    def set_bytecode_cache_dir(cls, cache_dir):
+        """
+        Enables a persistent cache of compiled template bytecode in the given directory so that a new process can
+        skip compiling templates that were already compiled by an earlier one.  Cache entries are keyed by the
+        template hash and render options, stale entries from a different jinja or python version are ignored.
+        :param cache_dir: directory for the cache files, created if missing.  None disables the cache.
+        :return: None
+        """
+        if cache_dir is None:
+            cls._bytecode_cache = None
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+            cls._bytecode_cache = FileSystemBytecodeCache(cache_dir, cls.k_bytecode_cache_pattern)
+
+    @classmethod
+    def _get_environment(cls, opts_key):
+        env = cls._template_envs.get(opts_key)
+        if env is None:
+            env = Environment(**dict(opts_key))
+            cls._template_envs[opts_key] = env
+        return env
+
+    @classmethod
+    def _compile_template(cls, template_text, template_hash=None, render_opts=None):
+        """
+        Returns the compiled jinja template for the given template text.  Compiled templates are kept in a
+        least recently used cache shared by all instances so that the same template is only parsed and compiled once.
+        :param template_text: jinja formatted template text
+        :param template_hash: hex digest of the template text, computed if not provided
+        :param render_opts: dictionary of jinja environment options, defaults to k_render_opts
+        :return: compiled jinja template
+        """
+        if template_hash is None:
+            template_hash = hashlib.sha1(template_text.encode('utf-8')).hexdigest()
+        opts_key = tuple(sorted((render_opts or cls.k_render_opts).items()))
+        key = (template_hash, opts_key)
+
+        with cls._template_cache_lock:
+            template = cls._template_cache.get(key)
+            if template is not None:
+                cls._template_cache.move_to_end(key)
+                cls.template_cache_hits += 1
+                return template
+            cls.template_cache_misses += 1
+            env = cls._get_environment(opts_key)
+            bytecode_cache = cls._bytecode_cache
+
+        # Compile outside of the lock, a concurrent compile of the same template is harmless
+        if bytecode_cache is None:
+            template = env.from_string(template_text)
+        else:
+            bucket = bytecode_cache.get_bucket(env, "{0:s}{1!r}".format(template_hash, opts_key), None, template_text)
+            if bucket.code is None:
+                bucket.code = env.compile(template_text)
+                bytecode_cache.set_bucket(bucket)
+            template = env.template_class.from_code(env, bucket.code, env.make_globals(None))
+
+        with cls._template_cache_lock:
+            cls._template_cache[key] = template
+            cls._template_cache.move_to_end(key)
+            while len(cls._template_cache) > max(cls.template_cache_size, 1):
+                cls._template_cache.popitem(last=False)
+        return template
+
+    def _get_template(self):
+        if self._template_hash is None:
+            self._template_hash = hashlib.sha1(self._template_text.encode('utf-8')).hexdigest()
+        return self._compile_template(self._template_text, self._template_hash)
+
+    def copy(self):
+        """
+        Returns a copy that shares the template but has its own mapped data context, e.g. to render on a worker
+        thread while this instance keeps being modified.
+        :return: new ConstrainedText instance
+        """
+        new_text = ConstrainedText()
+        new_text._jin_cntxt = dict(self._jin_cntxt)
+        new_text._template_text = self._template_text
+        new_text._template_hash = self._template_hash
+        new_text._template_refs = self._template_refs
+        new_text._has_data = self._has_data
+        new_text._has_template = self._has_template
+        return new_text
+
     def can_render(self):
         """
         Returns true of the constrained text is ready to be rendered, otherwise returns false.
@@ -120,6 +346,42 @@ class ConstrainedText:
     def template_text(self):
         return self._template_text
 
+    def _get_template_refs(self):
+        if self._template_refs is None:
+            opts_key = tuple(sorted(self.k_render_opts.items()))
+            names, keys = _find_template_refs(self._get_environment(opts_key).parse(self._template_text))
+            self._template_refs = (
+                {k: sorted(v) for k, v in names.items()},
+                {k: sorted(v) for k, v in keys.items()}
+            )
+        return self._template_refs
+
+    def template_variables(self):
+        """
+        Returns the context variables referenced by the template.  The template is parsed once and the result is
+        cached until a new template is loaded.
+        :return: dictionary of variable names and the sorted list of template line numbers using the variable
+        """
+        return self._get_template_refs()[0]
+
+    def template_subscripts(self):
+        """
+        Returns the constant keys and attributes looked up on context variables by the template,
+        e.g. ('kw', 'DISCIP.SAS.2NDFLOW.40.T_T') for kw["DISCIP.SAS.2NDFLOW.40.T_T"].
+        :return: dictionary of (variable name, key) tuples and the sorted list of template line numbers using them
+        """
+        return self._get_template_refs()[1]
+
+    def template_keywords(self, var_name='kw'):
+        """
+        Returns the keywords referenced by the template through the keyword dictionary variable (kw["..."] or
+        kw.get("...")), this is the AST based equivalent of file_utils.get_keywords_in_text.  Dictionary methods
+        such as kw.items() are not keywords.
+        :param var_name: name of the keyword dictionary variable
+        :return: dictionary of keywords and the sorted list of template line numbers using them
+        """
+        return {k[1]: v for k, v in self.template_subscripts().items() if k[0] == var_name}
+
     def render_textlines(self):
         if not self.can_render():
             return None
@@ -132,6 +394,383 @@ class ConstrainedText:
         if not self.can_render():
             return None
         else:
-            template = Template(self._template_text, trim_blocks=True, lstrip_blocks=True)
+            template = self._get_template()
             rendered_string = str(template.render(self._jin_cntxt))
             return rendered_string
+
+    def render_tagged(self):
+        """
+        Renders the text and separates the line tags from the visible text in a single pass.
+        :return: RenderedText record or None if the text cannot be rendered
+        """
+        if not self.can_render():
+            return None
+
+        visible_lines = []
+        tags = array('B')
+        offsets = array('q')
+        position = 0
+        for line in self.render_text().split('\n'):
+            tag = self.k_line_none
+            if '{@' in line:
+                stripped = line.rstrip()
+                if stripped.endswith(self.k_tag_ro):
+                    tag = self.k_line_ro
+                    line = line.split(self.k_tag_ro)[0]
+                elif stripped.endswith(self.k_tag_rw):
+                    tag = self.k_line_rw
+                    line = line.split(self.k_tag_rw)[0]
+                elif stripped.endswith(self.k_tag_map):
+                    tag = self.k_line_map
+                    line = line.split(self.k_tag_map)[0]
+            visible_lines.append(line)
+            tags.append(tag)
+            offsets.append(position)
+            position += len(line) + 1
+        return RenderedText("\n".join(visible_lines), tags, offsets)
+
+    def render_to(self, path_or_fileobj, encoding=None, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        """
+        Renders the text and streams the generated pieces straight to a file without building the complete
+        rendered string in memory.
+        :param path_or_fileobj: path of the file to be written or an open text file object
+        :param encoding: text encoding used when a path is given, defaults to the locale preferred encoding
+        :param buffer_size: size of the write buffer in bytes used when a path is given
+        :return: the path or file object written to, None if the text cannot be rendered
+        """
+        if not self.can_render():
+            return None
+        template = self._get_template()
+        if isinstance(path_or_fileobj, (str, bytes, os.PathLike)):
+            with open(path_or_fileobj, "wt", encoding=encoding, buffering=buffer_size) as fout:
+                fout.writelines(template.generate(self._jin_cntxt))
+        else:
+            path_or_fileobj.writelines(template.generate(self._jin_cntxt))
+        return path_or_fileobj
+
+    def render_batch(self, mapped_data_sets, output_paths=None, max_workers=None):
+        """
+        Renders this template against many mapped data sets (e.g. the points of a design sweep) on a pool of
+        worker processes.  The template is sent to each worker once and compiled once per worker, using the bytecode
+        cache directory if one is set.  The mapped data sets are read from the iterable as the renders progress, at
+        most two per worker are queued at a time.
+        :param mapped_data_sets: iterable of mapped data dictionaries in the form accepted by get_mapped_data
+        :param output_paths: optional sequence of file paths, one per mapped data set.  When given the rendered
+         text is streamed to these files by the workers instead of being sent back.
+        :param max_workers: number of worker processes, defaults to the number of processors
+        :return: generator yielding (index, rendered text or output path) tuples in the order the renders finish
+        """
+        if not self._has_template:
+            raise Exception('A template must be loaded before rendering a batch of mapped data sets.')
+        cache_dir = self._bytecode_cache.directory if self._bytecode_cache is not None else None
+        return self._render_batch(mapped_data_sets, output_paths, max_workers or os.cpu_count() or 1, cache_dir)
+
+    def _render_batch(self, mapped_data_sets, output_paths, max_workers, cache_dir):
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker,
+                                       initargs=(self._template_text, cache_dir))
+        pending = set()
+        try:
+            for i, mapped_data in enumerate(mapped_data_sets):
+                if len(pending) >= 2 * max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        yield f.result()
+                out_path = output_paths[i] if output_paths is not None else None
+                pending.add(executor.submit(_render_batch_item, i, mapped_data, out_path))
+            for f in as_completed(pending):
+                yield f.result()
+        finally:
+            # Drop any pending renders if the caller stops consuming the results early
+            for f in pending:
+                f.cancel()
+            executor.shutdown(wait=True)
+
+
+class RenderedText:
+    """
+    Rendered constrained text with the line tags stripped out.  Holds the visible text together with a compact array
+    of the ConstrainedText line tag code (k_line_*) and the character offset of every line in the visible text.
+    """
+
+    def __init__(self, text, tags, offsets):
+        self.text = text
+        self.tags = tags
+        self.offsets = offsets
+
+    def line_count(self):
+        return len(self.tags)
+
+    def line(self, line_number):
+        start = self.offsets[line_number]
+        if line_number + 1 < len(self.offsets):
+            return self.text[start:self.offsets[line_number + 1] - 1]
+        return self.text[start:]
+
+
+# Constrained text instance of a render_batch worker process
+_batch_text = None
+
+
+def _init_batch_worker(template_text, cache_dir):
+    global _batch_text
+    if cache_dir is not None:
+        ConstrainedText.set_bytecode_cache_dir(cache_dir)
+    _batch_text = ConstrainedText()
+    _batch_text._template_text = template_text
+    _batch_text._has_template = True
+
+
+def _render_batch_item(index, mapped_data, output_path):
+    _batch_text.get_mapped_data(mapped_data)
+    if output_path is not None:
+        _batch_text.render_to(output_path)
+        return index, output_path
+    return index, _batch_text.render_text()
+
+
+def _find_template_refs(node):
+    """
+    Walks a jinja AST and finds the context variables it references.
+    :param node: jinja AST node
+    :return: tuple of two dictionaries, the first maps variable names to the set of line numbers where the variable
+     is used as a whole, the second maps (variable name, key) tuples to the line numbers where the variable is only
+     subscripted with a constant key or attribute (e.g. kw["DISCIP.SAS.2NDFLOW"] or kw.get("DISCIP.SAS.2NDFLOW"))
+    """
+    names = {}
+    keys = {}
+    stored = set()
+    keyed = set()
+    method_calls = {id(c.node): c for c in node.find_all(nodes.Call) if isinstance(c.node, nodes.Getattr)}
+    for n in node.find_all((nodes.Getitem, nodes.Getattr)):
+        if not isinstance(n.node, nodes.Name) or n.node.ctx != 'load':
+            continue
+        if isinstance(n, nodes.Getattr):
+            call = method_calls.get(id(n))
+            if call is not None:
+                # kw.get("...") only reads the constant key, any other method call (kw.items(), ...) reads the
+                # whole variable
+                if n.attr != 'get' or not _is_const_lookup(call):
+                    continue
+                key = call.args[0].value
+            elif n.attr in _RenderIndex.k_mapping_attrs:
+                continue  # kw.items etc. resolve to the dictionary method rather than a key
+            else:
+                key = n.attr
+        elif isinstance(n.arg, nodes.Const):
+            key = n.arg.value
+        else:
+            continue
+        keys.setdefault((n.node.name, key), set()).add(n.lineno)
+        keyed.add(id(n.node))
+    for n in node.find_all(nodes.Name):
+        if n.ctx != 'load':
+            stored.add(n.name)
+        elif id(n) not in keyed:
+            names.setdefault(n.name, set()).add(n.lineno)
+
+    # Anything assigned within the template (loop targets, set, macro arguments) is not a context variable
+    stored.update(_RenderIndex.k_ignored_names)
+    names = {k: v for k, v in names.items() if k not in stored}
+    keys = {k: v for k, v in keys.items() if k[0] not in stored}
+    return names, keys
+
+
+def _is_const_lookup(call):
+    return (0 < len(call.args) <= 2 and isinstance(call.args[0], nodes.Const) and not call.kwargs
+            and call.dyn_args is None and call.dyn_kwargs is None)
+
+
+class _RenderIndex:
+    """
+    Render state for incrementally updating a ConstrainedText.  The template is split into chunks of lines that can be
+    rendered independently of each other.  Each chunk becomes a jinja macro of a single compiled template whose module
+    shares the live context dictionary, so calling a chunk macro renders it with the current mapped values.  Templates
+    that cannot be split are kept as a single chunk rendered through the full template.
+    """
+
+    # Tags that change the scope or structure of the template across lines, templates using them are not split
+    k_unsplittable_tags = {'set', 'macro', 'call', 'import', 'from', 'include', 'extends', 'block'}
+    k_block_tags = {'if', 'for', 'filter', 'with', 'autoescape', 'trans'}
+    k_ignored_names = {'loop', 'caller', 'varargs', 'kwargs'}
+    k_mapping_attrs = frozenset(dir(dict))  # Attributes jinja resolves to dictionary methods instead of keys
+    k_chunk_macro = 'ct_chunk_{0:d}'
+    re_ws_ctrl = re.compile(r'{[%{#]-|-[%}#]}')
+
+    def __init__(self, env, template_text, template, context):
+        self._template = template
+        self._context = context
+        self._module = None
+        self.chunk_macros = [None]
+        self.var_chunks = {}  # variable name -> set of chunk indices
+        self.key_chunks = {}  # (variable name, key) -> set of chunk indices
+        self.keyed_var_chunks = {}  # variable name -> set of chunk indices referencing any of its keys
+        self.outputs = None
+        self.line_counts = None
+        self.offsets = None
+
+        chunks = self._split_template(env, template_text)
+        if chunks is None or len(chunks) < 2:
+            return
+
+        macro_src = []
+        for i, chunk in enumerate(chunks):
+            # '{%+' keeps lstrip_blocks from eating trailing white space of the chunk's last line
+            macro_src.append("{{% macro {0:s}() %}}\n{1:s}{{%+ endmacro %}}".format(self.k_chunk_macro.format(i), chunk))
+        macro_src = "".join(macro_src)
+        try:
+            macro_tmpl = env.from_string(macro_src)
+            macro_ast = env.parse(macro_src)
+        except TemplateSyntaxError:
+            return
+
+        for i, macro in enumerate(macro_ast.find_all(nodes.Macro)):
+            names, keys = _find_template_refs(macro)
+            for name in names:
+                self.var_chunks.setdefault(name, set()).add(i)
+            for key in keys:
+                self.key_chunks.setdefault(key, set()).add(i)
+                self.keyed_var_chunks.setdefault(key[0], set()).add(i)
+
+        self._module = macro_tmpl.make_module(ChainMap(context, env.globals), shared=True)
+        self.chunk_macros = [getattr(self._module, self.k_chunk_macro.format(i)) for i in range(len(chunks))]
+
+    @property
+    def is_split(self):
+        return self._module is not None
+
+    def _split_template(self, env, template_text):
+        """
+        Splits the template text into chunks of whole lines, only breaking between lines that are neither inside a
+        jinja tag nor inside a block statement (if, for, ...).
+        :return: list of chunk strings or None if the template cannot be split
+        """
+        if self.re_ws_ctrl.search(template_text):
+            return None
+
+        # Jinja drops a single trailing newline from the template so do the same before splitting
+        if template_text.endswith('\n'):
+            template_text = template_text[:-1]
+        lines = template_text.split('\n')
+        no_break = bytearray(len(lines) + 1)  # no_break[n] set when the text cannot be split after line n
+
+        depth = 0
+        tag_start = block_start = None
+        expect_tag_name = block_closed = False
+        try:
+            for lineno, tok, val in env.lex(template_text):
+                if tok.endswith('_begin'):
+                    tag_start = lineno
+                    expect_tag_name = tok == 'block_begin'
+                elif tok == 'name' and expect_tag_name:
+                    expect_tag_name = False
+                    if val in self.k_unsplittable_tags:
+                        return None
+                    elif val in self.k_block_tags:
+                        if depth == 0:
+                            block_start = tag_start
+                        depth += 1
+                    elif val.startswith('end'):
+                        depth -= 1
+                        block_closed = depth == 0
+                elif tok.endswith('_end'):
+                    for n in range(tag_start, lineno):
+                        no_break[n] = 1
+                    if block_closed:
+                        for n in range(block_start, lineno):
+                            no_break[n] = 1
+                        block_closed = False
+        except TemplateSyntaxError:
+            return None
+        if depth != 0:
+            return None
+
+        chunks = []
+        chunk_start = 0
+        for n in range(1, len(lines) + 1):
+            if n == len(lines):
+                chunks.append('\n'.join(lines[chunk_start:]))
+            elif not no_break[n]:
+                chunks.append('\n'.join(lines[chunk_start:n]) + '\n')
+                chunk_start = n
+        return chunks
+
+    def _render_chunk(self, i):
+        if not self.is_split:
+            return str(self._template.render(self._context))
+        output = str(self.chunk_macros[i]())
+        if output and not output.endswith('\n') and i < len(self.chunk_macros) - 1:
+            # A block tag consumed the chunk's final line ending, the chunks no longer map onto whole lines
+            raise _ChunkBoundaryError()
+        return output
+
+    @staticmethod
+    def _split_lines(output):
+        if not output:
+            return []
+        lines = output.split('\n')
+        if output.endswith('\n'):
+            lines.pop()
+        return lines
+
+    def _render_all(self):
+        try:
+            self.outputs = [self._render_chunk(i) for i in range(len(self.chunk_macros))]
+        except _ChunkBoundaryError:
+            self._module = None
+            self.chunk_macros = [None]
+            self.outputs = [self._render_chunk(0)]
+        self.line_counts = [len(self._split_lines(o)) for o in self.outputs]
+        self.offsets = [0] + list(accumulate(self.line_counts))[:-1]
+
+    def _affected_chunks(self, name, old_value, new_value):
+        affected = set(self.var_chunks.get(name, ()))
+        if name in self.keyed_var_chunks:
+            if isinstance(old_value, Mapping) and isinstance(new_value, Mapping):
+                missing = object()
+                for k in set(old_value).union(new_value):
+                    if old_value.get(k, missing) != new_value.get(k, missing):
+                        affected.update(self.key_chunks.get((name, k), ()))
+            else:
+                affected.update(self.keyed_var_chunks[name])
+        return affected
+
+    def update(self, changes):
+        if self.outputs is None:
+            self._render_all()
+
+        affected = set()
+        for name, value in changes.items():
+            if self.is_split:
+                affected.update(self._affected_chunks(name, self._context.get(name), value))
+            self._context[name] = value
+        if not self.is_split and changes:
+            affected.add(0)
+
+        spans = []
+        new_outputs = {}
+        try:
+            for i in sorted(affected):
+                output = self._render_chunk(i)
+                if output != self.outputs[i]:
+                    new_outputs[i] = output
+        except _ChunkBoundaryError:
+            old_count = sum(self.line_counts)
+            self._module = None
+            self.chunk_macros = [None]
+            self._render_all()
+            return [(0, old_count, self._split_lines(self.outputs[0]))]
+
+        counts_changed = False
+        for i, output in sorted(new_outputs.items()):
+            new_lines = self._split_lines(output)
+            spans.append((self.offsets[i], self.line_counts[i], new_lines))
+            counts_changed = counts_changed or len(new_lines) != self.line_counts[i]
+            self.outputs[i] = output
+            self.line_counts[i] = len(new_lines)
+        if counts_changed:
+            self.offsets = [0] + list(accumulate(self.line_counts))[:-1]
+        return spans
+
+
+class _ChunkBoundaryError(Exception):
+    pass
@@ -0,0 +1,448 @@
+import copy
+from collections.abc import KeysView, ItemsView, ValuesView, MutableMapping
+
+_MISSING = object()
+_DELETED = object()  # Marks a key deleted on top of a layer that still holds it
+
+# Values that cannot be changed in place and are therefore shared between layers and forks as they are
+_IMMUTABLE_TYPES = frozenset((str, bytes, int, float, complex, bool, type(None), frozenset, range))
+
+
+class _Frozen:
+    """
+    Immutable layer of dictionary content shared by a CowDict and its forks: a large bottom dictionary and a small
+    delta of the keys changed on top of it.  Neither is ever changed once the layer is created, an update creates a
+    new layer sharing the bottom dictionary and copying only the delta, which is merged into a new bottom once it
+    grows to half the size of the bottom so updates cost time in proportion to the changes.
+
+    Values are immutable values, plain dictionaries and CowDicts given to a CowDict constructor, nested layers and
+    private snapshots of mutable values.  Nothing in a layer is handed out to be changed.
+    """
+
+    __slots__ = ('bottom', 'delta', 'size')
+
+    def __init__(self, bottom, delta=None, size=None):
+        self.bottom = bottom
+        self.delta = delta if delta is not None else {}
+        self.size = size if size is not None else len(bottom)
+
+    def get(self, key, default=_MISSING):
+        if self.delta:
+            value = self.delta.get(key, _MISSING)
+            if value is not _MISSING:
+                return default if value is _DELETED else value
+        return self.bottom.get(key, default)
+
+    def contains(self, key):
+        return self.get(key) is not _MISSING
+
+    def __iter__(self):
+        delta = self.delta
+        if not delta:
+            return iter(self.bottom)
+        return self.__iter_delta(delta)
+
+    def __iter_delta(self, delta):
+        bottom = self.bottom
+        for key in bottom:
+            if delta.get(key) is not _DELETED:
+                yield key
+        for key, value in delta.items():
+            if value is not _DELETED and key not in bottom:
+                yield key
+
+    def __reversed__(self):
+        delta = self.delta
+        bottom = self.bottom
+        for key in reversed(delta):
+            if delta[key] is not _DELETED and key not in bottom:
+                yield key
+        for key in reversed(bottom):
+            if delta.get(key) is not _DELETED:
+                yield key
+
+    def items(self):
+        if not self.delta:
+            return self.bottom.items()
+        return ((key, self.get(key)) for key in self)
+
+    def updated(self, changes):
+        """
+        :param changes: dictionary of new values, _DELETED for the deleted keys
+        :return: new layer with the changes applied on top of this one
+        """
+        if not changes:
+            return self
+        bottom = self.bottom
+        delta = dict(self.delta)
+        size = self.size
+        for key, value in changes.items():
+            present = self.contains(key)
+            if value is _DELETED:
+                if present:
+                    size -= 1
+                if key in bottom:
+                    delta[key] = _DELETED
+                else:
+                    delta.pop(key, None)
+            else:
+                if not present:
+                    size += 1
+                if delta.get(key) is _DELETED:
+                    # Added again after being deleted, it goes to the end as in a dict
+                    bottom, delta = self.__merged(bottom, delta), {}
+                delta[key] = value
+        if len(delta) * 2 > len(bottom):
+            return _Frozen(self.__merged(bottom, delta))
+        return _Frozen(bottom, delta, size)
+
+    @staticmethod
+    def __merged(bottom, delta):
+        bottom = dict(bottom)
+        for key, value in delta.items():
+            if value is _DELETED:
+                del bottom[key]
+            else:
+                bottom[key] = value
+        return bottom
+
+
+_EMPTY = _Frozen({})
+
+
+class CowDict(dict):
+    """
+    Copy-on-write dictionary for job data.  Its content is an immutable layer shared with its forks plus a private
+    layer of the changes made through it, so fork() only has to freeze the changes made since the last fork and a
+    fork only uses memory for its own changes.  Reading a nested dictionary returns a CowDict over the shared nested
+    layer, so changing a nested value only records the change.  Other mutable values (lists, sets, objects) are
+    copied the first time they are read from the shared layer, and snapshotted on each fork since they can be
+    changed in place.  Changes made through a dictionary or the values read from it are never seen through its
+    forks and the other way around, as if it had been deep copied.
+
+    CowDict is a dict for isinstance checks, but its content is only reachable through the dict methods, code
+    reading the dict internals directly (the C json encoder) sees it empty.  The dictionary
+    given to the constructor and the values stored in it are kept as they are, the caller must not change them in
+    place through other references afterwards.
+    """
+
+    __slots__ = ('_base', '_over', '_dirty', '_parent', '_key', '_size')
+
+    def __init__(self, data=None, **kwargs):
+        """
+        :param data: mapping or iterable of key value pairs, a CowDict is forked
+        """
+        super(CowDict, self).__init__()
+        if isinstance(data, CowDict):
+            base = data._freeze()
+        elif data:
+            base = _Frozen(dict(data))
+        else:
+            base = _EMPTY
+        self._init_layers(base)
+        if kwargs:
+            self.update(kwargs)
+
+    def _init_layers(self, base, parent=None, key=None):
+        self._base = base
+        self._over = {}  # Values changed or read since the last fork, _DELETED for deleted keys
+        self._dirty = {}  # Keys to freeze on the next fork, in the order they changed
+        self._parent = parent  # Dictionary holding this one as a nested dictionary, told about its changes
+        self._key = key
+        self._size = base.size
+
+    @classmethod
+    def _from_frozen(cls, base, parent=None, key=None):
+        new_dict = dict.__new__(cls)  # Skips __init__, this is the hot path when nested dictionaries are read
+        new_dict._base = base
+        new_dict._over = {}
+        new_dict._dirty = {}
+        new_dict._parent = parent
+        new_dict._key = key
+        new_dict._size = base.size
+        return new_dict
+
+    def _mark_dirty(self, key):
+        dirty = self._dirty
+        if key in dirty:
+            return
+        dirty[key] = None
+        if len(dirty) == 1 and self._parent is not None:
+            self._parent._mark_dirty(self._key)
+
+    def _release(self, value):
+        if isinstance(value, CowDict) and value._parent is self:
+            value._parent = None
+
+    def _load(self, key, value):
+        # Turns a value of the shared layer into one that may be changed through this dictionary
+        value_type = type(value)
+        if value_type is _Frozen or value_type is dict:
+            nested = self._from_frozen(value if value_type is _Frozen else _Frozen(value), self, key)
+        elif isinstance(value, CowDict):
+            nested = self._from_frozen(value._freeze(), self, key)
+        else:
+            private = copy.deepcopy(value)
+            if private is value:
+                return value  # Immutable, e.g. a tuple of numbers
+            self._over[key] = private
+            self._mark_dirty(key)
+            return private
+        self._over[key] = nested
+        return nested
+
+    def _freeze(self):
+        """
+        Moves the changes made since the last fork into a new shared layer
+        :return: the new shared layer
+        """
+        dirty = self._dirty
+        if not dirty:
+            return self._base
+        over = self._over
+        changes = {}
+        volatile = {}  # Keys whose values can still change without this dictionary knowing
+        for key in dirty:
+            value = over.get(key, _MISSING)
+            if value is _MISSING:
+                continue
+            if value is _DELETED or type(value) in _IMMUTABLE_TYPES:
+                changes[key] = value
+                del over[key]
+            elif isinstance(value, CowDict):
+                changes[key] = value._freeze()
+                if value._dirty or value._parent is not self:
+                    volatile[key] = None
+            else:
+                snapshot = copy.deepcopy(value)
+                changes[key] = snapshot
+                if snapshot is value:
+                    del over[key]
+                else:
+                    volatile[key] = None
+        self._base = self._base.updated(changes)
+        self._dirty = volatile
+        return self._base
+
+    def fork(self):
+        """
+        :return: independent copy sharing the current content of this dictionary (see class description)
+        """
+        return self._from_frozen(self._freeze())
+
+    def __getitem__(self, key):
+        value = self._over.get(key, _MISSING)
+        if value is _MISSING:
+            base = self._base
+            value = base.get(key) if base.delta else base.bottom.get(key, _MISSING)
+            if type(value) in _IMMUTABLE_TYPES:
+                return value
+            if value is _MISSING:
+                raise KeyError(key)
+            return self._load(key, value)
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        over = self._over
+        old = over.get(key, _MISSING)
+        if old is _DELETED:
+            self._freeze()  # Applies the deletion so the key is added again at the end, as in a dict
+            old = _MISSING
+        if old is _MISSING:
+            if not self._base.contains(key):
+                self._size += 1
+        else:
+            self._release(old)
+        if isinstance(value, CowDict) and value._parent is None and value is not self:
+            value._parent = self
+            value._key = key
+        over[key] = value
+        self._mark_dirty(key)
+
+    def __delitem__(self, key):
+        over = self._over
+        old = over.get(key, _MISSING)
+        if old is _DELETED or (old is _MISSING and not self._base.contains(key)):
+            raise KeyError(key)
+        self._release(old)
+        if self._base.contains(key):
+            over[key] = _DELETED
+            self._mark_dirty(key)
+        else:
+            del over[key]
+            self._dirty.pop(key, None)
+        self._size -= 1
+
+    def __contains__(self, key):
+        value = self._over.get(key, _MISSING)
+        if value is not _MISSING:
+            return value is not _DELETED
+        return self._base.contains(key)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        over = self._over
+        base = self._base
+        for key in base:
+            if over.get(key) is not _DELETED:
+                yield key
+        for key, value in over.items():
+            if value is not _DELETED and not base.contains(key):
+                yield key
+
+    def __reversed__(self):
+        over = self._over
+        base = self._base
+        for key in reversed(over):
+            if over[key] is not _DELETED and not base.contains(key):
+                yield key
+        for key in reversed(base):
+            if over.get(key) is not _DELETED:
+                yield key
+
+    def _iter_items(self):
+        over = self._over
+        base = self._base
+        for key, value in base.items():
+            current = over.get(key, _MISSING)
+            if current is _MISSING:
+                if type(value) not in _IMMUTABLE_TYPES:
+                    value = self._load(key, value)
+            elif current is _DELETED:
+                continue
+            else:
+                value = current
+            yield key, value
+        for key, value in list(over.items()):
+            if value is not _DELETED and not base.contains(key):
+                yield key, value
+
+    def _raw_items(self):
+        # Current content without loading the shared values
+        over = self._over
+        for key in self:
+            value = over.get(key, _MISSING)
+            yield key, self._base.get(key) if value is _MISSING else value
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *args):
+        if key not in self:
+            if args:
+                return args[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        for key in reversed(self):
+            return key, self.pop(key)
+        raise KeyError('popitem(): dictionary is empty')
+
+    def update(self, *args, **kwargs):
+        MutableMapping.update(self, *args, **kwargs)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        new_dict = self.fork()
+        new_dict.update(other)
+        return new_dict
+
+    def __ror__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        new_dict = CowDict(other)
+        new_dict.update(self)
+        return new_dict
+
+    def copy(self):
+        return self.fork()
+
+    def __copy__(self):
+        return self.fork()
+
+    def __deepcopy__(self, memo):
+        return self.fork()
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self._plain() == (other._plain() if isinstance(other, CowDict) else other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def _plain(self):
+        # Plain nested dictionary of the content sharing all the values, only used to compare and pickle
+        return {k: _plain_value(v) for k, v in self._raw_items()}
+
+    def to_dict(self):
+        """
+        :return: plain nested dictionary of the content, independent of this one
+        """
+        return copy.deepcopy(self._plain())
+
+    def __reduce__(self):
+        return CowDict, (self._plain(),)
+
+    def __repr__(self):
+        return 'CowDict({0!r})'.format(self._plain())
+
+
+class _ItemsView(ItemsView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _ValuesView(ValuesView):
+    __slots__ = ()
+
+    def __iter__(self):
+        for _, value in self._mapping._iter_items():
+            yield value
+
+
+def _plain_value(value):
+    if isinstance(value, CowDict):
+        return value._plain()
+    if type(value) is _Frozen:
+        return {k: _plain_value(v) for k, v in value.items()}
+    return value
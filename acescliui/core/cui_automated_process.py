@@ -3,13 +3,19 @@ import logging
 import os
 import uuid
 
+from .constrained_text import ConstrainedText
+
 
 class CuiAutomatedProcess:
 
-    def __init__(self, tool_core=None, resource_path=None):
+    def __init__(self, tool_core=None, resource_path=None, template_cache_dir=None):
         self._tool_core = tool_core
         self._rscr_path = resource_path
 
+        # Reuse compiled templates from earlier runs
+        if template_cache_dir:
+            ConstrainedText.set_bytecode_cache_dir(template_cache_dir)
+
         # Initialize job folder
         self._job_id = str(uuid.uuid4())
         inp_port_key = list(tool_core.inputs.keys())[0]
@@ -75,7 +81,8 @@ class CuiAutomatedProcess:
         """
         Implement this method to create the final input in the format required by the analysis.
         For instance create the necessary inputs files from the set of input data by performing keyword
-        substitution into the models using the parameters in the self._input_data dictionary
+        substitution into the models using the parameters in the self._input_data dictionary.  Rendered
+        templates can be written with ConstrainedText.render_to to avoid holding the complete text in memory.
         :return: 
         """
 
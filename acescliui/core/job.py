@@ -4,6 +4,8 @@ import uuid
 import shutil
 import logging
 
+from .cow_dict import CowDict
+
 
 class Job:
     """
@@ -56,15 +58,25 @@ class Job:
         self.__data = new_data
 
     def copy_data(self, job):
-        self.__data = copy.deepcopy(job.data)
+        if isinstance(job.data, JobData):
+            self.__data = job.data.fork()
+        else:
+            self.__data = copy.deepcopy(job.data)
 
 
 class JobData:
 
     def __init__(self, inputs=None, outputs=None, custom=None):
-        self.__inputs = inputs  # Key value pairs of input data
-        self.__outputs = outputs  # Key value pairs of output data
-        self.__custom = custom  # Key value pairs of any type of data
+        """
+        The dictionaries are stored as copy-on-write dictionaries sharing their values (see CowDict), they must not be
+        changed in place afterwards
+        :param inputs:
+        :param outputs:
+        :param custom:
+        """
+        self.__inputs = self.__as_cow_dict(inputs)  # Key value pairs of input data
+        self.__outputs = self.__as_cow_dict(outputs)  # Key value pairs of output data
+        self.__custom = self.__as_cow_dict(custom)  # Key value pairs of any type of data
 
     @property
     def inputs(self):
@@ -78,11 +90,25 @@ class JobData:
     def custom(self):
         return self.__custom
 
+    def fork(self):
+        """
+        Copies the job data, the copy shares the current content with this one and only stores its own changes
+        (see CowDict)
+        :return: new JobData
+        """
+        return JobData(*[copy.deepcopy(d) for d in (self.__inputs, self.__outputs, self.__custom)])
+
+    @staticmethod
+    def __as_cow_dict(data):
+        if isinstance(data, dict) and not isinstance(data, CowDict):
+            return CowDict(data)
+        return data
+
     def add_input(self, input_key, input_value):
         if self.__inputs:
             self.__inputs[input_key] = input_value
         else:
-            self.__inputs = {input_key: input_value}
+            self.__inputs = CowDict({input_key: input_value})
 
     def get_input_data(self, key):
         if key in self.__inputs:
@@ -94,7 +120,7 @@ class JobData:
         if self.__inputs:
             self.__inputs[output_key] = output_value
         else:
-            self.__inputs = {output_key: output_value}
+            self.__inputs = CowDict({output_key: output_value})
 
     def get_output_data(self, key):
         if key in self.__outputs:
@@ -106,7 +132,7 @@ class JobData:
         if self.__custom:
             self.__custom[key] = value
         else:
-            self.__custom = {key: value}
+            self.__custom = CowDict({key: value})
 
     def get_custom_data(self, key):
         if key in self.__custom:
@@ -1,8 +1,15 @@
 import os
 import copy
 import uuid
+import stat
 import shutil
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .job_registry import JobRegistry
+from .cow_dict import CowDict
+from .blob_store import BlobStore
 
 
 class JobManager:
@@ -16,9 +23,42 @@ class JobManager:
     JOB_STATUS_CPLT = 'COMPLETE'
     JOB_STATUS_ERR = 'ERROR'
 
-    def __init__(self, jobs_root):
+    BLOB_STORE_DIR = '.blobs'  # Directory of the blob store under the jobs root
+    TRASH_DIR = '.trash'  # Directory under the jobs root of the deleted job directories not yet removed
+    DELETE_WORKERS = 4  # Number of threads removing deleted job directories
+
+    def __init__(self, jobs_root, registry_path=None, use_blob_store=False, deletion_progress_callback=None):
+        """
+        :param jobs_root: directory holding the job directories
+        :param registry_path: optional path of an SQLite database persisting the jobs, the jobs registered in it
+         by earlier sessions are restored.  Jobs are only kept in memory if not given
+        :param use_blob_store: stage files into the jobs from a content addressed store under the jobs root (see
+         BlobStore and stage_job_files) instead of copying them
+        :param deletion_progress_callback: optional function called with the number of removed and deleted job
+         directories each time a deleted job directory has been removed, called from a worker thread
+        """
         self.__jobs = {}  # Dictionary of analysis jobs by uuid
+        self.__use_blob_store = use_blob_store
+        self.__blob_store = None
+        self.__deleter = None  # Thread pool removing the job directories moved to the trash
+        self.__deleter_stop = None  # Event telling the workers of the thread pool to skip their remaining work
+        self.__deletion_lock = threading.Lock()
+        self.__deletions_total = 0
+        self.__deletions_done = 0
+        self.__deletion_progress_callback = deletion_progress_callback
         self.jobs_root = jobs_root
+        self.__registry = None
+        if registry_path:
+            self.__registry = JobRegistry(registry_path)
+
+            # Only the indexed columns are read, the job data is loaded on first access
+            for job_id, job_path, job_status, model_id in self.__registry.jobs():
+                self.__jobs[job_id] = {
+                    'uuid': job_id,
+                    'path': job_path,
+                    'status': job_status,
+                    'model_id': model_id,
+                }
 
     @property
     def jobs_root(self):
@@ -28,14 +68,30 @@ class JobManager:
     def jobs_root(self, jobs_root):
         self.__jobs_root = jobs_root
 
+        # Created up front rather than on first use, the store is also used by the deletion workers and must not be
+        # created twice by concurrent callers
+        self.__blob_store = None
+        if self.__use_blob_store and jobs_root:
+            self.__blob_store = BlobStore(os.path.join(jobs_root, self.BLOB_STORE_DIR))
+        self.__resume_deletions()
+
+    @property
+    def blob_store(self):
+        """Blob store of the jobs root, None if not used"""
+        return self.__blob_store
+
     def count(self):
         return len(self.__jobs)
 
-    def create_job(self, job_id=None, job_status=JOB_STATUS_NEW, job_data=None):
+    def create_job(self, job_id=None, job_status=JOB_STATUS_NEW, job_data=None, src_dir=None, read_only=False):
         """
         :param job_id:
         :param job_status:
-        :param job_data: dictionary containing any additional properties to be stored with the job
+        :param job_data: dictionary containing any additional properties to be stored with the job.  It is stored as a
+         copy-on-write dictionary (see CowDict) sharing its values, so it must not be changed in place afterwards,
+         change the dictionary returned by get_job_data instead.
+        :param src_dir: optional directory of files to place into the new job directory (see stage_job_files)
+        :param read_only: files of the source directory the job never writes (see stage_job_files)
         :return: tuple containing the job id and job path
         """
         if not job_id:
@@ -47,7 +103,7 @@ class JobManager:
             os.makedirs(job_path)
         except FileExistsError as e:
             logging.exception('Job path already exists when attempting to create a job.  Will remove old job and retry.')
-            shutil.rmtree(job_path)
+            self.__remove_job_path(job_path)
             os.makedirs(job_path)
 
         new_job = {
@@ -57,17 +113,28 @@ class JobManager:
         }
         if not job_data:
             new_job['data'] = {}
+        job_data = self._as_cow_dict(job_data)
         new_job['data'] = job_data
+        new_job['model_id'] = self._model_id(job_data)
         self.__jobs[job_id] = new_job
+        if self.__registry:
+            self.__registry.put_job(job_id, job_path, job_status, new_job['model_id'], job_data)
+        if src_dir:
+            self.stage_job_files(job_id, src_dir, read_only=read_only)
         return job_id, job_path
 
     def clone_job(self, job_id):
         """
-
+        Clones the job, the job data of the clone is a fork of the cloned job's copy-on-write dictionary (see CowDict),
+        both jobs share the current content and only store their own changes afterwards
         :param job_id:
         :return: tuple containing the newly cloned job id and job path
         """
-        old_job_data = copy.deepcopy(self.get_job_data(job_id))
+        job_data = self.get_job_data(job_id)
+        if isinstance(job_data, CowDict):
+            old_job_data = job_data.fork()
+        else:
+            old_job_data = copy.deepcopy(job_data)
         new_job_id, new_job_path = self.create_job(job_data=old_job_data)
         self.update_job(new_job_id, job_status=self.get_job_status(job_id))
         return new_job_id, new_job_path
@@ -86,22 +153,134 @@ class JobManager:
                 and job_status != self.JOB_STATUS_ERR:
             raise Exception('Invalid status value when trying to update job properties')
         else:
-            self.__jobs[job_id]['status'] = job_status
+            self.set_job_status(job_id, job_status)
 
         if job_data:
-            self.__jobs[job_id]['data'] = job_data
+            self.set_job_data(job_id, job_data)
+
+    def stage_job_files(self, job_id, src_dir, symlinks=False, read_only=False):
+        """
+        Places the files of the source directory into the job directory, from the blob store if used, otherwise
+        by copying them
+        :param job_id:
+        :param src_dir: directory of the files to stage, e.g. the model files
+        :param symlinks: recreate symbolic links instead of staging the files they point to
+        :param read_only: the job never writes the files, they are then hard linked to the blobs shared with other
+         jobs and must be replaced rather than changed in place (see BlobStore.stage_tree and BlobStore.unshare).
+         Either a bool for all the files or a function of the source file path returning a bool.
+        :return: number of bytes saved by not copying the files
+        """
+        job_path = self.get_job_path(job_id)
+        if self.blob_store:
+            return self.blob_store.stage_tree(src_dir, job_path, symlinks, read_only)
+        for name in os.listdir(src_dir):
+            src_name = os.path.join(src_dir, name)
+            dst_name = os.path.join(job_path, name)
+            if symlinks and os.path.islink(src_name):
+                os.symlink(os.readlink(src_name), dst_name)
+            elif os.path.isdir(src_name):
+                shutil.copytree(src_name, dst_name, symlinks)
+            else:
+                shutil.copy2(src_name, dst_name)
+        return 0
+
+    @staticmethod
+    def _remove_readonly(func, path, exc_info):
+        # Read only files cannot be removed on Windows.  A hard link shares its permissions with the blob and the
+        # other jobs, so it is never made writable (the blob store does not hard link on Windows).
+        if os.stat(path).st_nlink > 1:
+            raise exc_info[1]
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
 
     def delete_job(self, job_id):
+        """
+        Deletes the job, its directory is moved to the trash directory of the jobs root and removed in the background
+        (see deletion_progress and wait_for_deletions)
+        :param job_id:
+        :return: nothing
+        """
         # TODO: what if job is still running?  Maybe use lck file, if exists, no delete?
         del_job = self.__jobs[job_id]
         del_path = del_job['path']
-        shutil.rmtree(del_path)
+        self.__remove_job_path(del_path)
         self.__jobs.pop(job_id)
+        if self.__registry:
+            self.__registry.delete_job(job_id)
 
     def delete_all_jobs(self):
-        keys = list(self.__jobs.keys())
-        for jid in keys:
-            self.delete_job(jid)
+        for del_job in self.__jobs.values():
+            self.__remove_job_path(del_job['path'])
+        self.__jobs.clear()
+        if self.__registry:
+            self.__registry.delete_all_jobs()
+
+    def deletion_progress(self):
+        """
+        :return: tuple of the number of removed and deleted job directories since the trash was last empty
+        """
+        with self.__deletion_lock:
+            return self.__deletions_done, self.__deletions_total
+
+    def wait_for_deletions(self):
+        """Blocks until the deleted job directories have been removed"""
+        if self.__deleter:
+            self.__deleter.shutdown(wait=True)
+            self.__deleter = None
+
+    def __trash_path(self):
+        return os.path.join(self.jobs_root, self.TRASH_DIR)
+
+    def __remove_job_path(self, job_path):
+
+        # Renaming is atomic and instant, the directory is then removed by a worker thread.  A directory that cannot
+        # be moved to the trash, e.g. outside the jobs root, is removed right away
+        trash_path = os.path.join(self.__trash_path(), '{0}.{1}'.format(os.path.basename(job_path), uuid.uuid4().hex))
+        try:
+            os.makedirs(self.__trash_path(), exist_ok=True)
+            os.rename(job_path, trash_path)
+        except OSError:
+            logging.exception(' Could not move job path {0} to the trash, removing it in place'.format(job_path))
+            shutil.rmtree(job_path, onerror=self._remove_readonly)
+            return
+        self.__submit_deletion(trash_path)
+
+    def __resume_deletions(self):
+
+        # Removes the job directories left in the trash by an earlier session, e.g. after a crash
+        if not self.jobs_root or not os.path.isdir(self.__trash_path()):
+            return
+        for entry in os.scandir(self.__trash_path()):
+            self.__submit_deletion(entry.path)
+
+    def __submit_deletion(self, trash_path):
+        with self.__deletion_lock:
+            self.__deletions_total += 1
+            if self.__deleter is None:
+                self.__deleter = ThreadPoolExecutor(max_workers=self.DELETE_WORKERS, thread_name_prefix='job_delete')
+                self.__deleter_stop = threading.Event()
+            self.__deleter.submit(self.__delete_trash_path, trash_path, self.__deleter_stop)
+
+    def __delete_trash_path(self, trash_path, stop):
+        if stop.is_set():
+            return
+        try:
+            if os.path.isdir(trash_path) and not os.path.islink(trash_path):
+                shutil.rmtree(trash_path, onerror=self._remove_readonly)
+            else:
+                os.remove(trash_path)
+        except OSError:
+            logging.exception(' Could not remove deleted job path {0}'.format(trash_path))
+
+        with self.__deletion_lock:
+            self.__deletions_done += 1
+            done, total = self.__deletions_done, self.__deletions_total
+            if done == total:
+                self.__deletions_done = self.__deletions_total = 0
+        if done == total and self.blob_store:
+            self.blob_store.prune()  # Blobs only linked into the removed jobs are no longer needed
+        if self.__deletion_progress_callback:
+            self.__deletion_progress_callback(done, total)
 
     def has_job_id(self, job_id):
         return job_id in self.__jobs
@@ -109,19 +288,87 @@ class JobManager:
     def get_job_path(self, job_id):
         return self.__jobs[job_id]['path']
 
+    def get_job_ids(self):
+        return list(self.__jobs.keys())
+
+    def get_job_ids_with_status(self, status):
+        if self.__registry:
+            return self.__registry.job_ids_with_status(status)
+        return [k for k, v in self.__jobs.items() if v['status'] == status]
+
+    def get_job_ids_with_model_id(self, model_id):
+        if self.__registry:
+            return self.__registry.job_ids_with_model_id(model_id)
+        return [k for k, v in self.__jobs.items() if v['model_id'] == model_id]
+
     def get_job_status(self, job_id):
         return self.__jobs[job_id]['status']
 
     def set_job_status(self, job_id, status):
         self.__jobs[job_id]['status'] = status
+        if self.__registry:
+            self.__registry.set_status(job_id, status)
+
+    def get_job_model_id(self, job_id):
+        return self.__jobs[job_id]['model_id']
 
     def get_job_data(self, job_id):
-        return self.__jobs[job_id]['data']
+        job = self.__jobs[job_id]
+        if 'data' not in job:
+            job['data'] = self._as_cow_dict(self.__registry.get_data(job_id))
+        return job['data']
 
     def set_job_data(self, job_id, new_data):
-        self.__jobs[job_id]['data'] = new_data
+        """
+        :param job_id:
+        :param new_data: job data, stored like the job data of create_job
+        :return: nothing
+        """
+        self.__jobs[job_id]['data'] = self._as_cow_dict(new_data)
+        self.save_job_data(job_id)
+
+    @staticmethod
+    def _as_cow_dict(job_data):
+        if isinstance(job_data, dict) and not isinstance(job_data, CowDict):
+            return CowDict(job_data)
+        return job_data
+
+    def save_job_data(self, job_id):
+        """
+        Writes the job data to the registry, if any.  Must be called after the job data has been changed in place
+        for the change to persist.
+        :param job_id:
+        :return: nothing
+        """
+        job = self.__jobs[job_id]
+        job['model_id'] = self._model_id(job['data'])
+        if self.__registry:
+            self.__registry.set_data(job_id, job['model_id'], job['data'])
+
+    def close(self):
+        """
+        Closes the registry, if any, and stops removing deleted job directories.  The directories left in the trash
+        are removed the next time a job manager is created for the jobs root.  Raises the exception of a job change
+        that could not be written to the registry, if any.
+        """
+        if self.__deleter:
+            self.__deleter_stop.set()
+            self.__deleter.shutdown(wait=False)
+            self.__deleter = None
+        if self.__registry:
+            registry = self.__registry
+            self.__registry = None
+            registry.close()  # Raises if job changes could not be written
+
+    @staticmethod
+    def _model_id(job_data):
+        try:
+            return job_data['model']['id']
+        except (KeyError, TypeError):
+            return None
 
     def _get_job(self, job_id):
+        self.get_job_data(job_id)
         return self.__jobs[job_id]
 
     def _get_job_with_path(self, job_path):
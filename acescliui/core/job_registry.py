@@ -0,0 +1,128 @@
+import copy
+import pickle
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobRegistry:
+    """
+    Persistent store of the jobs of a JobManager in an SQLite database, so the jobs survive a restart or crash of the
+    application.  The job data is pickled and only read when requested, so registering many jobs at startup only
+    reads the small indexed columns.
+
+    Changes are written in order on a background thread, so pickling large job data does not block the caller.  The
+    job data is snapshotted with copy.deepcopy when the change is made, which is cheap for copy-on-write job data
+    (see CowDict).  Reads wait for the queued changes to be written first.  A change that could not be written is
+    reported by raising its exception from the next flush, read or close.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: path of the database file, created if it does not exist
+        """
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.__lock, self.__conn:
+            self.__conn.execute('PRAGMA journal_mode=WAL')
+            self.__conn.execute('PRAGMA synchronous=NORMAL')
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                                'uuid TEXT PRIMARY KEY, path TEXT NOT NULL, status TEXT NOT NULL, model_id TEXT, '
+                                'data BLOB)')
+            self.__conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+            self.__conn.execute('CREATE INDEX IF NOT EXISTS jobs_model_id ON jobs (model_id)')
+        self.__writer = ThreadPoolExecutor(max_workers=1)
+        self.__last_write = None
+        self.__write_error = None  # Exception of the first change that could not be written since the last flush
+
+    def close(self):
+        self.__writer.shutdown(wait=True)
+        with self.__lock:
+            self.__conn.close()
+        self.__raise_write_error()
+
+    def flush(self):
+        """Waits until the queued changes are written, raises the exception of a change that could not be written"""
+        last_write = self.__last_write
+        if last_write is not None:
+            last_write.exception()
+        self.__raise_write_error()
+
+    def __raise_write_error(self):
+        error = self.__write_error
+        if error is not None:
+            self.__write_error = None
+            raise error
+
+    def __write(self, sql, params, job_data=None):
+        self.__last_write = self.__writer.submit(self.__execute, sql, params, job_data)
+
+    def __execute(self, sql, params, job_data):
+        try:
+            if job_data is not None:
+                params = dict(params, data=self.__dump(job_data))
+            with self.__lock, self.__conn:
+                self.__conn.execute(sql, params)
+        except Exception as e:
+            logging.exception(' Failed to write to the job registry')
+            if self.__write_error is None:
+                self.__write_error = e
+
+    def jobs(self):
+        """
+        :return: list of (uuid, path, status, model id) of all the registered jobs in registration order
+        """
+        self.flush()
+        with self.__lock:
+            return self.__conn.execute('SELECT uuid, path, status, model_id FROM jobs ORDER BY rowid').fetchall()
+
+    def put_job(self, job_id, job_path, job_status, model_id, job_data):
+        params = {'uuid': job_id, 'path': job_path, 'status': job_status, 'model_id': model_id}
+        if job_data is None:
+            self.__write('INSERT OR REPLACE INTO jobs (uuid, path, status, model_id) '
+                         'VALUES (:uuid, :path, :status, :model_id)', params)
+        else:
+            self.__write('INSERT OR REPLACE INTO jobs (uuid, path, status, model_id, data) '
+                         'VALUES (:uuid, :path, :status, :model_id, :data)', params, copy.deepcopy(job_data))
+
+    def set_status(self, job_id, job_status):
+        self.__write('UPDATE jobs SET status = :status WHERE uuid = :uuid', {'uuid': job_id, 'status': job_status})
+
+    def set_data(self, job_id, model_id, job_data):
+        params = {'uuid': job_id, 'model_id': model_id}
+        if job_data is None:
+            self.__write('UPDATE jobs SET model_id = :model_id, data = NULL WHERE uuid = :uuid', params)
+        else:
+            self.__write('UPDATE jobs SET model_id = :model_id, data = :data WHERE uuid = :uuid', params,
+                         copy.deepcopy(job_data))
+
+    def get_data(self, job_id):
+        self.flush()
+        with self.__lock:
+            row = self.__conn.execute('SELECT data FROM jobs WHERE uuid = ?', (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return pickle.loads(row[0]) if row[0] is not None else None
+
+    def job_ids_with_status(self, job_status):
+        self.flush()
+        with self.__lock:
+            rows = self.__conn.execute('SELECT uuid FROM jobs WHERE status = ? ORDER BY rowid', (job_status,))
+            return [r[0] for r in rows]
+
+    def job_ids_with_model_id(self, model_id):
+        self.flush()
+        with self.__lock:
+            rows = self.__conn.execute('SELECT uuid FROM jobs WHERE model_id = ? ORDER BY rowid', (model_id,))
+            return [r[0] for r in rows]
+
+    def delete_job(self, job_id):
+        self.__write('DELETE FROM jobs WHERE uuid = :uuid', {'uuid': job_id})
+
+    def delete_all_jobs(self):
+        self.__write('DELETE FROM jobs', {})
+
+    @staticmethod
+    def __dump(job_data):
+        return pickle.dumps(job_data, protocol=pickle.HIGHEST_PROTOCOL)
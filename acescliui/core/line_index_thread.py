@@ -0,0 +1,64 @@
+import re
+import mmap
+import logging
+from array import array
+from itertools import islice
+from PyQt5 import QtCore
+from PyQt5.QtCore import QThread
+
+
+class LineIndexThread(QThread):
+    """
+    Scans a text file through a memory map and builds a sparse index holding the byte offset of every
+    stride-th line, so that any line can be found by seeking to the nearest indexed line.
+    """
+
+    # Signals, the first argument is the emitting thread so receivers can ignore signals of a replaced thread that
+    # were still queued
+    notify_index_progress = QtCore.pyqtSignal(object, object, object, name='notifyIndexProgress')
+    notify_index_complete = QtCore.pyqtSignal(object, object, name='notifyIndexComplete')
+
+    k_block_size = 4 * 1024 * 1024
+    re_newline = re.compile(b'\n')
+
+    def __init__(self, file_path, stride):
+        super(QThread, self).__init__()
+        self.__file_path = file_path
+        self.__stride = stride
+        self.__cancelled = False
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def run(self):
+        try:
+            with open(self.__file_path, 'rb') as fin:
+                size = fin.seek(0, 2)
+                if size == 0:
+                    self.notify_index_complete.emit(self, 0)
+                    return
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    self._scan(mm, size)
+        except (OSError, ValueError):
+            logging.exception(' Failed to index lines of {0:s}'.format(self.__file_path))
+
+    def _scan(self, mm, size):
+        stride = self.__stride
+        n_newlines = 0
+        pos = 0
+        while pos < size:
+            if self.__cancelled:
+                return
+            block = mm[pos:pos + self.k_block_size]
+
+            # Record the start of every line following a newline whose number is a multiple of the stride
+            skip = -(n_newlines + 1) % stride
+            offsets = array('q', (pos + m.end() for m in islice(self.re_newline.finditer(block), skip, None, stride)))
+            n_newlines += block.count(b'\n')
+            pos += len(block)
+
+            # Emits the offsets of the next indexed lines and the number of complete lines found so far
+            self.notify_index_progress.emit(self, offsets, n_newlines)
+
+        last_byte = mm[size - 1:size]
+        self.notify_index_complete.emit(self, n_newlines if last_byte == b'\n' else n_newlines + 1)
@@ -0,0 +1,85 @@
+from fnmatch import fnmatchcase
+from itertools import chain
+
+
+class _SegmentNode:
+    __slots__ = ('children', 'rows')
+
+    def __init__(self):
+        self.children = {}  # Child node of each following name segment
+        self.rows = []  # Rows of all the names in this node's subtree, ascending
+
+
+class ParameterIndex:
+    """
+    Search index over dot separated parameter names (e.g. the harmonized nomenclature DISCIP.SAS.2NDFLOW.40.X), built
+    as a trie of the name segments.  Each trie node holds the rows of all the names below it, so a search only walks
+    the segments of the pattern and returns the stored rows of the matching nodes without scanning the names.
+    """
+
+    k_separator = '.'
+
+    def __init__(self, names):
+        """
+        :param names: iterable of parameter names, a name's row is its position in the iterable
+        """
+        self._root = _SegmentNode()
+        self._names = list(names)
+        sep = self.k_separator
+        for row, name in enumerate(self._names):
+            node = self._root
+            node.rows.append(row)
+            for seg in name.upper().split(sep):
+                child = node.children.get(seg)
+                if child is None:
+                    child = node.children[seg] = _SegmentNode()
+                child.rows.append(row)
+                node = child
+
+    def __len__(self):
+        return len(self._names)
+
+    def name(self, row):
+        return self._names[row]
+
+    def search_rows(self, pattern):
+        """
+        Returns the rows of the names matching the pattern, case insensitive.  The pattern is split into segments at
+        the dots, all but the last segment must match a whole name segment and the last one is matched as a prefix
+        (so the results narrow down while a name is typed).  Segments may contain the * and ? wildcards, a * segment
+        matches any single name segment.
+        :param pattern: search pattern, e.g. DISCIP.SAS.2NDFLOW.4 or DISCIP.*.2NDFLOW.40
+        :return: ascending sequence of rows
+        """
+        pattern = pattern.strip().upper()
+        if not pattern:
+            return self._root.rows
+        segs = pattern.split(self.k_separator)
+        nodes = [self._root]
+        for i, seg in enumerate(segs):
+            last = i == len(segs) - 1
+            next_nodes = []
+            for node in nodes:
+                if not any(c in seg for c in '*?['):
+                    if last:
+                        next_nodes.extend(child for s, child in node.children.items() if s.startswith(seg))
+                    elif seg in node.children:
+                        next_nodes.append(node.children[seg])
+                else:
+                    seg_pattern = seg + '*' if last else seg
+                    next_nodes.extend(child for s, child in node.children.items() if fnmatchcase(s, seg_pattern))
+            nodes = next_nodes
+            if not nodes:
+                return []
+
+        # The nodes are all at the same depth so their rows do not overlap
+        if len(nodes) == 1:
+            return nodes[0].rows
+        return sorted(chain.from_iterable(node.rows for node in nodes))
+
+    def search(self, pattern):
+        """
+        :param pattern: search pattern (see search_rows)
+        :return: list of the matching names in index order
+        """
+        return [self._names[r] for r in self.search_rows(pattern)]
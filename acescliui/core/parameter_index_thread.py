@@ -0,0 +1,32 @@
+import logging
+from PyQt5 import QtCore
+from PyQt5.QtCore import QThread
+
+from .parameter_index import ParameterIndex
+
+
+class ParameterIndexThread(QThread):
+    """
+    Builds the ParameterIndex of a list of parameter names in the background, so selecting a large data set does not
+    block the user interface while its search index is built.
+    """
+
+    # Signals
+    notify_index_complete = QtCore.pyqtSignal(object, object, name='notifyIndexComplete')
+
+    def __init__(self, names):
+        """
+        :param names: list of parameter names, should not be modified while the thread runs
+        """
+        super(QThread, self).__init__()
+        self.__names = names
+
+    def run(self):
+        try:
+            index = ParameterIndex(self.__names)
+        except Exception:
+            logging.exception(' Failed to build the parameter search index')
+            return
+
+        # Emits the thread along with the index so the receiver can drop indexes it no longer waits for
+        self.notify_index_complete.emit(self, index)
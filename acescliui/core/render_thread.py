@@ -0,0 +1,54 @@
+import logging
+from PyQt5 import QtCore
+from PyQt5.QtCore import QThread
+
+
+class CancellationToken:
+    """
+    Shared flag used to abandon a background render whose result is no longer wanted
+    """
+
+    def __init__(self):
+        self.__cancelled = False
+
+    @property
+    def cancelled(self):
+        return self.__cancelled
+
+    def cancel(self):
+        self.__cancelled = True
+
+
+class ConstrainedTextRenderThread(QThread):
+
+    # Signals
+    notify_render_complete = QtCore.pyqtSignal(object, object, name='notifyRenderComplete')
+    notify_render_failed = QtCore.pyqtSignal(object, str, name='notifyRenderFailed')
+
+    def __init__(self, constrained_text, token=None):
+        """
+        :param constrained_text: constrained text to render, should not be modified while the thread runs
+         (see ConstrainedText.copy)
+        :param token: cancellation token, a new one is created if not given
+        """
+        super(QThread, self).__init__()
+        self.__constrained_text = constrained_text
+        self.__token = token if token else CancellationToken()
+
+    @property
+    def token(self):
+        return self.__token
+
+    def run(self):
+        if self.__token.cancelled:
+            return
+        try:
+            rendered = self.__constrained_text.render_tagged()
+        except Exception as e:
+            logging.exception(' Rendering of constrained text failed')
+            self.notify_render_failed.emit(self.__token, str(e))
+            return
+
+        # Emits the rendered text record along with the token so the receiver can drop stale results
+        if not self.__token.cancelled:
+            self.notify_render_complete.emit(self.__token, rendered)
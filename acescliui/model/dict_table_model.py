@@ -0,0 +1,113 @@
+from itertools import islice
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant, QModelIndex
+
+
+class DictTableModel(QAbstractTableModel):
+    """
+    Read only table model reading directly from a dictionary of item dictionaries, e.g. {parameter: {'value': ..,
+    'units': ..}}, without copying it.  The first column shows the keys and the other columns the given fields of each
+    item.  Rows are populated incrementally through canFetchMore/fetchMore, so views show the first rows of very large
+    dictionaries immediately.  The rows can be restricted to a subset of the keys with set_key_filter.  Keys must
+    not be added to or removed from the dictionary while it is shown.
+    """
+
+    def __init__(self, data_dict, data_headers, item_fields, fetch_size=1000, parent=None):
+        """
+        :param data_dict: dictionary of item dictionaries
+        :param data_headers: list of column headers
+        :param item_fields: item dictionary field shown in each column after the key column, missing fields show as
+         an empty string
+        :param fetch_size: number of rows added per fetchMore
+        """
+        super(DictTableModel, self).__init__(parent)
+        self._dict = data_dict
+        self._headers = data_headers
+        self._fields = [None] + list(item_fields)
+        self._fetch_size = fetch_size
+        self._keys = []  # Keys of the rows fetched so far
+        self._key_rows = {}  # Row number of each fetched key
+        self._key_iter = iter(data_dict)
+        self._n_keys = len(data_dict)  # Number of rows once all are fetched
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._headers)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return len(self._keys) < self._n_keys
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        n_rows = min(self._fetch_size, self._n_keys - len(self._keys))
+        if n_rows <= 0:
+            return
+        first_row = len(self._keys)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + n_rows - 1)
+        for key in islice(self._key_iter, n_rows):
+            self._key_rows[key] = len(self._keys)
+            self._keys.append(key)
+        self.endInsertRows()
+
+    def set_key_filter(self, keys):
+        """
+        Only shows the items of the given keys, the rows are fetched incrementally again
+        :param keys: sequence of dictionary keys to show in the given order, None shows all the items
+        :return: None
+        """
+        self.beginResetModel()
+        if keys is None:
+            keys = self._dict
+        self._keys = []
+        self._key_rows = {}
+        self._key_iter = iter(keys)
+        self._n_keys = len(keys)
+        self.endResetModel()
+
+    def row_for_key(self, key):
+        """
+        :param key: dictionary key
+        :return: row number of the key or None if it is not in the dictionary or its row has not been fetched yet
+        """
+        return self._key_rows.get(key)
+
+    def items_changed(self, keys, column):
+        """
+        Notifies the views that a field of the given items was changed directly in the dictionary, with a single
+        signal spanning the fetched rows of the items.  Rows not fetched yet read the new values once they are fetched.
+        :param keys: keys of the changed items
+        :param column: column of the changed field
+        :return: None
+        """
+        rows = [r for r in (self._key_rows.get(k) for k in keys) if r is not None]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), column), self.index(max(rows), column), [Qt.EditRole])
+
+    def data(self, index, role):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return QVariant()
+        key = self._keys[index.row()]
+        if index.column() == 0:
+            return QVariant(key)
+        return QVariant(self._dict[key].get(self._fields[index.column()], ''))
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """The model is read only, the dictionary is changed by its owner (see items_changed)"""
+        return False
+
+    def headerData(self, sect, orient, role=None):
+        if orient == Qt.Horizontal and role == Qt.DisplayRole:
+            return QVariant(self._headers[sect])
+        return QVariant()
@@ -1,4 +1,4 @@
-from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant, QModelIndex
+from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant, QModelIndex, QTimer
 
 
 class TableModel(QAbstractTableModel):
@@ -10,6 +10,9 @@ class TableModel(QAbstractTableModel):
         self._data = initial_data
         # List of strings
         self._headers = data_headers
+        # Changed cells not yet notified while updates are throttled, row -> (first column, last column)
+        self._pending_changes = {}
+        self._update_timer = None
 
     def flags(self, index):
         return Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsSelectable
@@ -19,21 +22,131 @@ class TableModel(QAbstractTableModel):
             new_row = len(self._data)
         else:
             new_row = 1
+        self.flush_changes()
         self.beginInsertRows(QModelIndex(), new_row, new_row)
         self._data.append(new_data_item)
         self.endInsertRows()
         return new_row
 
     def remove_data_item(self, row):
+        self.flush_changes()
         self.beginRemoveRows(QModelIndex(), row, row)
         self._data.pop(row)
         self.endRemoveRows()
 
     def remove_all_data_items(self):
+        self.flush_changes()
         self.beginRemoveRows(QModelIndex(), 0, self.rowCount()-1)
         self._data.clear()
         self.endRemoveRows()
 
+    def add_data_items(self, new_data_items):
+        """
+        Appends several rows, notifying the views once
+        :param new_data_items: list of data items, one per row
+        :return: row number of the first added row
+        """
+        self.flush_changes()
+        first_row = self.rowCount()
+        if new_data_items:
+            self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_data_items) - 1)
+            self._insert_items(new_data_items)
+            self.endInsertRows()
+        return first_row
+
+    def remove_rows(self, rows):
+        """
+        Removes several rows, notifying the views once per run of consecutive rows
+        :param rows: row numbers, in any order
+        :return: None
+        """
+        self.flush_changes()
+        for first, last in reversed(self._row_runs(sorted(set(rows)))):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._delete_rows(first, last)
+            self.endRemoveRows()
+
+    def update_cells(self, cell_values):
+        """
+        Sets the values of several cells, notifying the views once per run of consecutive changed rows
+        :param cell_values: iterable of (row, column, value)
+        :return: number of rows with a changed value
+        """
+        changes = {}
+        for row, column, value in cell_values:
+            if self._set_cell(row, column, value):
+                first, last = changes.get(row, (column, column))
+                changes[row] = (min(first, column), max(last, column))
+        self._notify_changes(changes)
+        return len(changes)
+
+    def set_max_update_rate(self, updates_per_second):
+        """
+        Coalesces cell change notifications so the views are notified at most the given number of times per second,
+        e.g. while job statuses change at a high frequency
+        :param updates_per_second: maximum notification rate, None or 0 notifies every change immediately
+        :return: None
+        """
+        self.flush_changes()
+        if updates_per_second:
+            if self._update_timer is None:
+                self._update_timer = QTimer(self)
+                self._update_timer.setSingleShot(True)
+                self._update_timer.timeout.connect(self.flush_changes)
+            self._update_timer.setInterval(int(1000 / updates_per_second))
+        elif self._update_timer is not None:
+            self._update_timer.deleteLater()
+            self._update_timer = None
+
+    def flush_changes(self):
+        """Notifies the views of the cell changes held back by the update throttle, if any"""
+        if self._update_timer is not None:
+            self._update_timer.stop()
+        changes = self._pending_changes
+        self._pending_changes = {}
+        self._emit_changes(changes)
+
+    def _notify_changes(self, changes):
+        if self._update_timer is None:
+            self._emit_changes(changes)
+            return
+        for row, (first, last) in changes.items():
+            pending = self._pending_changes.get(row)
+            self._pending_changes[row] = (min(first, pending[0]), max(last, pending[1])) if pending else (first, last)
+        if self._pending_changes and not self._update_timer.isActive():
+            self._update_timer.start()
+
+    def _emit_changes(self, changes):
+
+        # One signal spanning the changed columns of each run of consecutive rows
+        rows = sorted(changes)
+        for first, last in self._row_runs(rows):
+            columns = [changes[r] for r in range(first, last + 1)]
+            self.dataChanged.emit(self.index(first, min(c[0] for c in columns)),
+                                  self.index(last, max(c[1] for c in columns)), [Qt.EditRole])
+
+    @staticmethod
+    def _row_runs(sorted_rows):
+        runs = []
+        for row in sorted_rows:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        return runs
+
+    def _insert_items(self, new_data_items):
+        self._data.extend(new_data_items)
+
+    def _delete_rows(self, first, last):
+        del self._data[first:last + 1]
+
+    def _set_cell(self, row, column, value):
+        if self._data[row][column] == value:
+            return False
+        self._data[row][column] = value
+        return True
+
     def rowCount(self, parent=None):
         row_len = 0
         if self._data:
@@ -61,7 +174,7 @@ class TableModel(QAbstractTableModel):
     def setData(self, index, value, role=Qt.EditRole):
         if index.isValid() and role == Qt.EditRole:
             self._data[index.row()][index.column()] = value
-            self.dataChanged.emit(index, index, [Qt.EditRole])
+            self._notify_changes({index.row(): (index.column(), index.column())})
             return True
         else:
             return False
@@ -70,3 +183,153 @@ class TableModel(QAbstractTableModel):
         if orient == Qt.Horizontal and role == Qt.DisplayRole:
             return QVariant(self._headers[sect])
         return QVariant()
+
+
+class KeyedTableModel(TableModel):
+    """
+    Table model storing its data column by column and keeping an index from the values of a key column (e.g. a job
+    id) to their row, so rows can be looked up and updated by key in constant time
+    """
+
+    def __init__(self, initial_data, data_headers, key_column=0, parent=None, *args):
+        super(KeyedTableModel, self).__init__([], data_headers, parent)
+        self._key_clm = key_column
+        self._columns = [[] for _ in data_headers]  # One list of values per column
+        self._key_rows = {}  # Row number of each key
+        for data_item in initial_data:
+            self._append_row(data_item)
+
+    def _append_row(self, data_item):
+        if len(data_item) != len(self._columns):
+            raise Exception('Number of values in the data item does not match the number of table columns')
+        key = data_item[self._key_clm]
+        if key in self._key_rows:
+            raise Exception('Key {0} is already in the table'.format(key))
+        self._key_rows[key] = len(self._columns[0])
+        for clm, value in zip(self._columns, data_item):
+            clm.append(value)
+
+    def _check_items(self, new_data_items):
+        keys = set()
+        for data_item in new_data_items:
+            if len(data_item) != len(self._columns):
+                raise Exception('Number of values in the data item does not match the number of table columns')
+            key = data_item[self._key_clm]
+            if key in self._key_rows or key in keys:
+                raise Exception('Key {0} is already in the table'.format(key))
+            keys.add(key)
+
+    def _reindex_rows(self, first_row):
+        keys = self._columns[self._key_clm]
+        for r in range(first_row, len(keys)):
+            self._key_rows[keys[r]] = r
+
+    def add_data_item(self, new_data_item):
+        return self.add_data_items([new_data_item])
+
+    def add_data_items(self, new_data_items):
+        self._check_items(new_data_items)
+        return super(KeyedTableModel, self).add_data_items(new_data_items)
+
+    def remove_data_item(self, row):
+        self.remove_rows([row])
+
+    def remove_rows(self, rows):
+        if not rows:
+            return
+        super(KeyedTableModel, self).remove_rows(rows)
+        self._reindex_rows(min(rows))
+
+    def remove_all_data_items(self):
+        if self.rowCount() == 0:
+            return
+        self.flush_changes()
+        self.beginRemoveRows(QModelIndex(), 0, self.rowCount()-1)
+        for clm in self._columns:
+            clm.clear()
+        self._key_rows.clear()
+        self.endRemoveRows()
+
+    def rowCount(self, parent=None):
+        return len(self._columns[0]) if self._columns else 0
+
+    def columnCount(self, parent=None):
+        return len(self._columns)
+
+    def data(self, index, role):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return QVariant()
+        return QVariant(self._columns[index.column()][index.row()])
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.isValid() and role == Qt.EditRole:
+            if index.column() == self._key_clm and value != self.key_for_row(index.row()) and value in self._key_rows:
+                return False
+            if self._set_cell(index.row(), index.column(), value):
+                self._notify_changes({index.row(): (index.column(), index.column())})
+            return True
+        else:
+            return False
+
+    def _insert_items(self, new_data_items):
+        for data_item in new_data_items:
+            self._append_row(data_item)
+
+    def _delete_rows(self, first, last):
+        keys = self._columns[self._key_clm]
+        for r in range(first, last + 1):
+            del self._key_rows[keys[r]]
+        for clm in self._columns:
+            del clm[first:last + 1]
+
+    def _set_cell(self, row, column, value):
+        clm = self._columns[column]
+        if clm[row] == value:
+            return False
+        if column == self._key_clm:
+            del self._key_rows[clm[row]]
+            self._key_rows[value] = row
+        clm[row] = value
+        return True
+
+    def row_for_key(self, key):
+        """
+        :param key: value of the key column
+        :return: row number of the key or None if the key is not in the table
+        """
+        return self._key_rows.get(key)
+
+    def key_for_row(self, row):
+        return self._columns[self._key_clm][row]
+
+    def value(self, key, column):
+        """
+        :param key: value of the key column of the row
+        :param column: column number
+        :return: value of the cell
+        """
+        return self._columns[column][self._key_rows[key]]
+
+    def set_value(self, key, column, value):
+        """
+        Sets the value of a cell in the row of the given key, the value of the key column cannot be changed this way
+        :param key: value of the key column of the row
+        :param column: column number
+        :param value: new value
+        :return: True if the value changed
+        """
+        return self.update_values([(key, column, value)]) > 0
+
+    def update_values(self, key_values):
+        """
+        Sets the values of several cells by the key of their row, notifying the views once per run of consecutive
+        changed rows
+        :param key_values: iterable of (key, column, value), the key column cannot be changed this way
+        :return: number of rows with a changed value
+        """
+        cell_values = []
+        for key, column, value in key_values:
+            if column == self._key_clm:
+                raise Exception('The key column cannot be changed by key')
+            cell_values.append((self._key_rows[key], column, value))
+        return self.update_cells(cell_values)
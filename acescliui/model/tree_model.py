@@ -1,15 +1,25 @@
+from itertools import islice
+
 from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt, QVariant
 
 
 class TreeItem(object):
+    __slots__ = ('parentItem', 'itemData', 'childItems', 'rowNumber', 'pendingData')
+
     def __init__(self, data, parent=None):
         self.parentItem = parent
         self.itemData = data
         self.childItems = []
+        self.rowNumber = 0  # Position in the parent's children
+        self.pendingData = None  # Iterator over the dictionary items of the children not created yet
 
     def appendChild(self, item):
+        item.rowNumber = len(self.childItems)
         self.childItems.append(item)
 
+    def hasPendingChildren(self):
+        return self.pendingData is not None
+
     def child(self, row):
         return self.childItems[row]
 
@@ -29,12 +39,17 @@ class TreeItem(object):
         return self.parentItem
 
     def row(self):
-        if self.parentItem:
-            return self.parentItem.childItems.index(self)
-        return 0
+        return self.rowNumber
 
 
 class TreeModel(QAbstractItemModel):
+    """
+    Tree model of a multi-level dictionary.  Only the top level items are created up front, the children of an item
+    are created from its dictionary when the view expands it (canFetchMore/fetchMore), in blocks of k_fetch_size
+    """
+
+    k_fetch_size = 1000
+
     def __init__(self, read_only_data, read_only_headers, parent=None):
         super(TreeModel, self).__init__(parent)
 
@@ -107,6 +122,36 @@ class TreeModel(QAbstractItemModel):
 
         return parentItem.childCount()
 
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+
+        if not parent.isValid():
+            parentItem = self.rootItem
+        else:
+            parentItem = parent.internalPointer()
+
+        return parentItem.childCount() > 0 or parentItem.hasPendingChildren()
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return self.rootItem.hasPendingChildren()
+        return parent.internalPointer().hasPendingChildren()
+
+    def fetchMore(self, parent):
+        if not parent.isValid():
+            parentItem = self.rootItem
+        else:
+            parentItem = parent.internalPointer()
+
+        new_items = self.__create_child_items(parentItem)
+        if new_items:
+            first_row = parentItem.childCount()
+            self.beginInsertRows(parent, first_row, first_row + len(new_items) - 1)
+            for new_item in new_items:
+                parentItem.appendChild(new_item)
+            self.endInsertRows()
+
     def setup_model_data(self, data, root_item):
         """
 
@@ -115,23 +160,42 @@ class TreeModel(QAbstractItemModel):
         :return: nothing
         """
 
-        # Recurse through read only dictionary and build tree model
-        self.__recurse_model_data(data, root_item)
+        # Create the first block of top level items, deeper items are created when their parent is expanded
+        self.__set_pending_data(root_item, data)
+        for new_item in self.__create_child_items(root_item):
+            root_item.appendChild(new_item)
+
+    @staticmethod
+    def __set_pending_data(item, data_dict):
+        item.pendingData = iter(data_dict.items()) if data_dict else None
 
-    def __recurse_model_data(self, data_dict, parent):
+    def __create_child_items(self, parent):
+        """
+        Creates the next block of child items of the parent from its pending dictionary items
+        :param parent: parent item
+        :return: list of the new items, not yet appended to the parent
+        """
+        new_items = []
+        if parent.pendingData is None:
+            return new_items
 
-        for k, v in data_dict.items():
+        for k, v in islice(parent.pendingData, self.k_fetch_size):
 
             if isinstance(v, dict):
                 # Parent to another leaf item
                 clm_data = [k, ""]
                 new_item = TreeItem(clm_data, parent)
-                parent.appendChild(new_item)
-                self.__recurse_model_data(v, new_item)
+                self.__set_pending_data(new_item, v)
+                new_items.append(new_item)
 
             else:
                 # this parent is a parameter leaf item with data values to be added as a child
                 clm_data = [k,v]
                 new_item = TreeItem(clm_data, parent)
-                parent.appendChild(new_item)
-                return
+                new_items.append(new_item)
+                parent.pendingData = None
+                return new_items
+
+        if len(new_items) < self.k_fetch_size:
+            parent.pendingData = None
+        return new_items
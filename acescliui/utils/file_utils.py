@@ -187,12 +187,16 @@ def get_keywords_in_xml(xml_tmpl):
     return kws
 
 
-def copy_into(src, dst, symlinks=False):
+def copy_into(src, dst, symlinks=False, blob_store=None, read_only=False):
     """
     Source copied from https://docs.python.org/3.5/library/shutil.html#module-shutil
     :param src:
     :param dst:
     :param symlinks:
+    :param blob_store: optional BlobStore, the files are then staged through the store instead of copied, see
+     BlobStore.stage_file
+    :param read_only: files never written at the destination, staged by hard linking their blob when a blob store
+     is given.  Either a bool for all the files or a function of the source file path returning a bool.
     :return:
     """
     names = os.listdir(src)
@@ -206,7 +210,12 @@ def copy_into(src, dst, symlinks=False):
                 linkto = os.readlink(srcname)
                 os.symlink(linkto, dstname)
             elif os.path.isdir(srcname):
-                shutil.copytree(srcname, dstname, symlinks)
+                if blob_store:
+                    blob_store.stage_tree(srcname, dstname, symlinks, read_only)
+                else:
+                    shutil.copytree(srcname, dstname, symlinks)
+            elif blob_store:
+                blob_store.stage_file(srcname, dstname, read_only(srcname) if callable(read_only) else read_only)
             else:
                 shutil.copy2(srcname, dstname)
             # XXX What about devices, sockets etc.?
@@ -6,106 +6,501 @@
 """
 
 # System imports
+from difflib import SequenceMatcher
 
 # PyQt imports
-from PyQt5.QtWidgets import QTextEdit
-from PyQt5.QtGui import QTextOption, QFont, QTextCursor, QColor
+from PyQt5.QtWidgets import QTextEdit, QMessageBox
+from PyQt5.QtGui import QTextOption, QFont, QColor, QSyntaxHighlighter, QTextCharFormat, QTextCursor, QKeySequence, QTextDocument
 from PyQt5 import QtCore
 
 # My imports
 from ..core.constrained_text import ConstrainedText
+from ..core.render_thread import CancellationToken, ConstrainedTextRenderThread
 
 
 class ConstrainedTextEdit(QTextEdit):
     """Represents a text editor that dynamically modifies the read only text
     based on the current selection"""
 
+    # Signals
+    notify_load_failed = QtCore.pyqtSignal(str, name='notifyLoadFailed')
+
+    # Block user state flags, bit 0 marks a read only line and bit 1 a mapped line
+    k_state_rw = 0
+    k_state_ro = 1
+    k_state_map = 3
+    k_state_map_bit = 2
+
+    # Block user state for each ConstrainedText line tag code
+    k_line_states = {
+        ConstrainedText.k_line_none: k_state_rw,
+        ConstrainedText.k_line_rw: k_state_rw,
+        ConstrainedText.k_line_ro: k_state_ro,
+        ConstrainedText.k_line_map: k_state_map,
+    }
+
+    # Key sequences (besides backspace and delete) that remove text and the cursor move selecting the text they remove
+    k_delete_keys = (
+        (QKeySequence.DeleteStartOfWord, QTextCursor.PreviousWord),
+        (QKeySequence.DeleteEndOfWord, QTextCursor.NextWord),
+        (QKeySequence.DeleteEndOfLine, QTextCursor.EndOfBlock),
+    )
+
     def __init__(self):
         super(ConstrainedTextEdit, self).__init__(parent=None)
         self.setWordWrapMode(QTextOption.NoWrap)
         self.setFont(QFont("Courier 10 Pitch", 10, 60))
+        self._highlighter = ConstrainedTextHighlighter(self.document())
+        self._load_token = None  # Cancellation token of the pending asynchronous load
+        self._placeholder_state = None  # Document, its parent and the read only state set aside by the placeholder
+        self._render_threads = []  # Keeps render threads alive until they finish
 
     def load(self, constrained_text):
 
         # Get the rendered constrained text to display to the editor
         if not constrained_text.can_render():
             raise Exception("The constrained text to be displayed in the text editor is not properly configured.  Either the data or the file template has not been loaded.")
-        raw_text = constrained_text.render_textlines()
-        visible_text = raw_text.copy()
-
-        # Make the text that is visible by striping out formatting rules
-        for i, line in enumerate(visible_text):
-            if line.strip().endswith(ConstrainedText.k_tag_ro):
-                visible_text[i] = "%s\n" % line.split(ConstrainedText.k_tag_ro)[0]
-            elif line.strip().endswith(ConstrainedText.k_tag_rw):
-                visible_text[i] = "%s\n" % line.split(ConstrainedText.k_tag_rw)[0]
-            elif line.strip().endswith(ConstrainedText.k_tag_map):
-                visible_text[i] = "%s\n" % line.split(ConstrainedText.k_tag_map)[0]
+        self.cancel_load()
+        self.apply_rendered(constrained_text.render_tagged())
+
+    def load_async(self, constrained_text, placeholder_text='Rendering ...'):
+        """
+        Renders the constrained text on a worker thread and shows it once done, in the meantime a read only
+        placeholder text is shown.  Any pending asynchronous load of this editor is cancelled.  If the load is
+        cancelled or rendering fails the previous document is shown again, a failure is reported to the user and
+        through notify_load_failed.
+        :param constrained_text: constrained text to display, a copy is rendered so it may be changed afterwards
+        :param placeholder_text: text shown while rendering
+        :return: cancellation token of the load
+        """
+        if not constrained_text.can_render():
+            raise Exception("The constrained text to be displayed in the text editor is not properly configured.  Either the data or the file template has not been loaded.")
+        self.cancel_load()
+
+        token = CancellationToken()
+        self._load_token = token
+        thread = ConstrainedTextRenderThread(constrained_text.copy(), token)
+        thread.notify_render_complete.connect(self._render_complete)
+        thread.notify_render_failed.connect(self._render_failed)
+        thread.finished.connect(self._render_thread_finished)
+        self._render_threads.append(thread)
+
+        self._show_placeholder(placeholder_text)
+        thread.start()
+        return token
+
+    def cancel_load(self):
+        """Cancels the pending asynchronous load, if any, and shows the document shown before the load again"""
+        if self._load_token:
+            self._load_token.cancel()
+            self._load_token = None
+            self._hide_placeholder()
+
+    def _show_placeholder(self, placeholder_text):
+
+        # The current document is set aside rather than overwritten so it can be shown again if the load does not
+        # complete.  Re-parenting it keeps the editor from deleting it when the placeholder replaces it.
+        doc = self.document()
+        self._placeholder_state = (doc, doc.parent(), self.isReadOnly())
+        doc.setParent(self)
+        placeholder = QTextDocument(self)
+        placeholder.setDefaultFont(self.font())
+        placeholder.setDefaultTextOption(doc.defaultTextOption())
+        placeholder.setPlainText(placeholder_text)
+        self.setDocument(placeholder)
+        self.setReadOnly(True)
+
+    def _hide_placeholder(self):
+        doc, parent, read_only = self._placeholder_state
+        self._placeholder_state = None
+        placeholder = self.document()
+        self.setDocument(doc)
+        doc.setParent(parent)
+        self.setReadOnly(read_only)
+        placeholder.deleteLater()
+
+    def is_loading(self):
+        """Returns true while an asynchronous load is pending"""
+        return self._load_token is not None
+
+    def detach_document(self):
+        """
+        Takes the current document out of the editor, which then shows a new empty document.  The returned
+        document keeps its text, line states and colors and can be shown again with attach_document.
+        :return: the detached QTextDocument
+        """
+        self.cancel_load()
+        doc = self.document()
+        doc.setParent(None)  # Keeps the editor from deleting the document when it is replaced
+        new_doc = QTextDocument()
+        new_doc.setDefaultFont(self.font())
+        new_doc.setDefaultTextOption(doc.defaultTextOption())
+        self._highlighter = ConstrainedTextHighlighter(new_doc)
+        self._set_document(new_doc)
+        return doc
+
+    def attach_document(self, doc):
+        """
+        Shows a document built with create_document or taken out of an editor with detach_document.  The editor
+        takes ownership of the document, the current document is deleted unless it was detached.
+        :param doc: QTextDocument to show
+        :return: None
+        """
+        self.cancel_load()
+        highlighter = doc.findChild(ConstrainedTextHighlighter)
+        self._highlighter = highlighter if highlighter else ConstrainedTextHighlighter(doc)
+        self._set_document(doc)
+        self.setReadOnly(False)
+
+    def _set_document(self, doc):
+
+        # The editor owns the documents it shows and deletes the one it replaces.  Detached documents have no parent
+        # and are kept, the initial document belongs to the text control of the editor which deletes it itself.
+        old_doc = self.document()
+        owned = old_doc is not doc and old_doc.parent() is self
+        doc.setParent(self)
+        self.setDocument(doc)
+        if owned:
+            old_doc.setParent(None)
+            old_doc.deleteLater()
+
+    def _render_complete(self, token, rendered):
+        if token.cancelled or token is not self._load_token:
+            return
+        self._load_token = None
+        self._hide_placeholder()
+        self.apply_rendered(rendered)
+
+    def _render_failed(self, token, message):
+        if token.cancelled or token is not self._load_token:
+            return
+        self._load_token = None
+        self._hide_placeholder()
+        self.notify_load_failed.emit(message)
+        QMessageBox.warning(self, 'Cannot Display Text', 'Rendering of the text failed:\n{0:s}'.format(message))
+
+    def _render_thread_finished(self):
+        self._render_threads = [t for t in self._render_threads if not t.isFinished()]
+
+    def apply_rendered(self, rendered):
+        """
+        Replaces the document with already rendered constrained text
+        :param rendered: RenderedText record (see ConstrainedText.render_tagged)
+        :return: None
+        """
+
+        # The text is colored in a new document before it is shown, coloring the lines of a shown document lays out
+        # the rest of the document again for every colored line
+        self.attach_document(self.create_document(rendered))
+
+    def create_document(self, rendered):
+        """
+        Builds a document of already rendered constrained text without showing it, so it can be prepared ahead of
+        time and later shown with attach_document.
+        :param rendered: RenderedText record (see ConstrainedText.render_tagged)
+        :return: QTextDocument with its lines flagged and colored
+        """
+        doc = QTextDocument()
+        doc.setDefaultFont(self.font())
+        doc.setDefaultTextOption(self.document().defaultTextOption())
+        doc.setPlainText(rendered.text)
+        self._set_line_states(doc, rendered.tags)
+
+        # Color the lines now, while the document has no layout, rather than on the next event loop pass
+        ConstrainedTextHighlighter(doc).rehighlight()
+        doc.clearUndoRedoStacks()
+        return doc
+
+    def _set_line_states(self, doc, tags):
+
+        # Flag read only, mapped and read-write lines of text in a single walk over the document blocks
+        block = doc.firstBlock()
+        for tag in tags:
+            block.setUserState(self.k_line_states[tag])
+            block = block.next()
+
+    def reload(self, constrained_text):
+        """
+        Re-renders the constrained text and only replaces the lines that differ from the current document, keeping
+        the scroll position, cursor position and undo history.  The reload is a single undo step.
+        :param constrained_text: constrained text to display
+        :return: None
+        """
+        if not constrained_text.can_render():
+            raise Exception("The constrained text to be displayed in the text editor is not properly configured.  Either the data or the file template has not been loaded.")
+        self.cancel_load()
+        self.apply_rendered_diff(constrained_text.render_tagged())
+
+    def apply_rendered_diff(self, rendered):
+        """
+        Updates the document to already rendered constrained text by applying a line level diff between the
+        current document and the rendered text inside a single edit block, which is one undo step.  The line states
+        of the changed lines before and after the edit are kept with the document so undoing or redoing the step
+        (see undo) restores them along with the text, the undo history of the writeable lines is kept.
+        :param rendered: RenderedText record (see ConstrainedText.render_tagged)
+        :return: None
+        """
+        doc = self.document()
+        old_lines = []
+        block = doc.firstBlock()
+        while block.isValid():
+            old_lines.append((block.text(), max(block.userState(), 0)))
+            block = block.next()
+        new_lines = list(zip(rendered.text.split('\n'), [self.k_line_states[t] for t in rendered.tags]))
+
+        # Only diff what lies between the common leading and trailing lines
+        n_pre = 0
+        n_max = min(len(old_lines), len(new_lines))
+        while n_pre < n_max and old_lines[n_pre] == new_lines[n_pre]:
+            n_pre += 1
+        n_post = 0
+        while n_post < n_max - n_pre and old_lines[-1 - n_post] == new_lines[-1 - n_post]:
+            n_post += 1
+        matcher = SequenceMatcher(None, old_lines[n_pre:len(old_lines) - n_post], new_lines[n_pre:len(new_lines) - n_post])
+        opcodes = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+        if not opcodes:
+            return
+
+        # Remember the view and cursor so they can be restored after the edit
+        h_scroll = self.horizontalScrollBar().value()
+        v_scroll = self.verticalScrollBar().value()
+        cursor_line = self.textCursor().blockNumber()
+        cursor_column = self.textCursor().positionInBlock()
+
+        # Line states of the changed lines and the lines bordering them, before and after the edit.  Splitting and
+        # merging blocks does not keep the user state of the bordering lines so these are flagged again as well.
+        old_ranges = []
+        new_ranges = []
+        for op, i1, i2, j1, j2 in opcodes:
+            first = max(i1 + n_pre - 1, 0)
+            old_ranges.append((first, [state for line, state in old_lines[first:i2 + n_pre + 1]]))
+            first = max(j1 + n_pre - 1, 0)
+            new_ranges.append((first, [state for line, state in new_lines[first:j2 + n_pre + 1]]))
+
+        n_old = len(old_lines)
+        cursor = QTextCursor(doc)
+        cursor.beginEditBlock()
+        for op, i1, i2, j1, j2 in reversed(opcodes):
+            i1, i2, j1, j2 = i1 + n_pre, i2 + n_pre, j1 + n_pre, j2 + n_pre
+            lines = [line for line, state in new_lines[j1:j2]]
+            if i2 < n_old:
+                # Replace whole lines including their line endings
+                start = doc.findBlockByNumber(i1).position()
+                end = doc.findBlockByNumber(i2).position()
+                text = "".join("{0:s}\n".format(line) for line in lines)
+            elif i1 > 0:
+                # The changed lines run to the end of the document, replace starting at the preceding line ending
+                prev_block = doc.findBlockByNumber(i1 - 1)
+                start = prev_block.position() + prev_block.length() - 1
+                end = doc.characterCount() - 1
+                text = "".join("\n{0:s}".format(line) for line in lines)
+            else:
+                start = 0
+                end = doc.characterCount() - 1
+                text = "\n".join(lines)
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        self._set_range_states(doc, new_ranges)
+        self._reload_steps(doc)[doc.availableUndoSteps()] = (old_ranges, new_ranges)
+
+        cursor_block = doc.findBlockByNumber(min(cursor_line, doc.blockCount() - 1))
+        cursor = QTextCursor(cursor_block)
+        cursor.setPosition(cursor_block.position() + min(cursor_column, cursor_block.length() - 1))
+        self.setTextCursor(cursor)
+        self.horizontalScrollBar().setValue(h_scroll)
+        self.verticalScrollBar().setValue(v_scroll)
+
+    def _set_range_states(self, doc, ranges):
+
+        # Flag and re-color lines, ranges is a list of (first line, line states)
+        for first, states in ranges:
+            block = doc.findBlockByNumber(first)
+            for state in states:
+                if not block.isValid():
+                    break
+                block.setUserState(state)
+                self._highlighter.rehighlightBlock(block)
+                block = block.next()
+
+    @staticmethod
+    def _reload_steps(doc):
+        """
+        Returns the line states of the reload undo steps of the document, a dictionary of (old ranges, new ranges)
+        keyed by the number of undo steps available right after the reload.  QTextDocument counts the undo steps by
+        revision, so the number of a step that was undone and replaced by another edit never comes back.
+        """
+        holder = doc.findChild(ReloadUndoSteps)
+        if holder is None:
+            holder = ReloadUndoSteps(doc)
+        return holder.steps
+
+    # ---------------------------------
+    # Read only line protection
+    # ---------------------------------
+
+    def _is_block_protected(self, block):
+        state = block.userState()
+        return state > 0 and state & self.k_state_ro
+
+    def _is_range_protected(self, start, end):
+        """Evaluates if any of the lines touched by the text between the two
+        positions is read only"""
+        block = self.document().findBlock(start)
+        while block.isValid() and block.position() <= end:
+            if self._is_block_protected(block):
+                return True
+            block = block.next()
+        return False
+
+    def _is_edit_protected(self, move_op=None):
+        """Evaluates if replacing the selection (or the text selected by moving the
+        cursor with the given operation) would change a read only line"""
+        cursor = self.textCursor()
+        if not cursor.hasSelection() and move_op is not None:
+            if move_op == QTextCursor.EndOfBlock and cursor.atBlockEnd():
+                move_op = QTextCursor.NextCharacter
+            cursor.movePosition(move_op, QTextCursor.KeepAnchor)
+        return self._is_range_protected(cursor.selectionStart(), cursor.selectionEnd())
+
+    def undo(self):
+        self._undo_redo(False)
+
+    def redo(self):
+        self._undo_redo(True)
+
+    def _undo_redo(self, redo):
+        """Undoes or redoes the next step of the document, a step that changes a read only line is reverted again
+        unless it is a reload, whose line states are restored"""
+        doc = self.document()
+        reload_steps = self._reload_steps(doc)
+
+        # A reload step is known by the number of undo steps available right after it, before undoing it or after
+        # redoing it
+        reload_ranges = None if redo else reload_steps.get(doc.availableUndoSteps())
+        changed = []
+
+        def record_change(position, chars_removed, chars_added):
+            changed.append((position, position + chars_added))
+
+        cursor = self.textCursor()
+        doc.contentsChange.connect(record_change)
+        try:
+            if redo:
+                doc.redo(cursor)
+                reload_ranges = reload_steps.get(doc.availableUndoSteps())
+            else:
+                doc.undo(cursor)
+        finally:
+            doc.contentsChange.disconnect(record_change)
+        if reload_ranges is not None:
+            self._set_range_states(doc, reload_ranges[1] if redo else reload_ranges[0])
+        elif any(self._is_range_protected(start, end) for start, end in changed):
+            if redo:
+                doc.undo(cursor)
             else:
-                visible_text[i] = "%s\n" % visible_text[i]
-        visible_text[-1] = visible_text[-1].split('\n')[0]
-        self.setText("".join(visible_text))
-
-        # Connect to cursor position changed signal
-        self.cursorPositionChanged.connect(self._alter_read_write)
-
-        # Differentiate read only versus read-write lines of text by color
-        current_cursor = self.textCursor()
-        current_cursor.beginEditBlock()
-        position = 0
-        for i, line in enumerate(raw_text):
-            if line.strip().endswith(ConstrainedText.k_tag_rw):  # Writeable line of text
-                cursor = QTextCursor(self.document())
-                cursor.setPosition(position)
-                cursor.setPosition(position + len(visible_text[i]), QTextCursor.KeepAnchor)
-                char_format = self.currentCharFormat()
-                char_format.setForeground(QColor("black"))
-                cursor.setCharFormat(char_format)
-                self.document().findBlockByLineNumber(i).setUserState(0)  # Add flag to denote that this line number is read-write
-            elif line.strip().endswith(ConstrainedText.k_tag_map):  # Mapped input line of text
-                cursor = QTextCursor(self.document())
-                cursor.setPosition(position)
-                cursor.setPosition(position + len(visible_text[i]), QTextCursor.KeepAnchor)
-                char_format = self.currentCharFormat()
-                char_format.setForeground(QColor("blue"))
-                cursor.setCharFormat(char_format)
-                self.document().findBlockByLineNumber(i).setUserState(1)  # Add flag to denote that this line number is read only
-            elif line.strip().endswith(ConstrainedText.k_tag_ro):  # Read only line of text
-                cursor = QTextCursor(self.document())
-                cursor.setPosition(position)
-                cursor.setPosition(position + len(visible_text[i]), QTextCursor.KeepAnchor)
-                char_format = self.currentCharFormat()
-                char_format.setForeground(QColor("black"))
-                cursor.setCharFormat(char_format)
-                self.document().findBlockByLineNumber(i).setUserState(1)  # Add flag to denote that this line number is read only
-            else:  # Writeable line of text
-                cursor = QTextCursor(self.document())
-                cursor.setPosition(position)
-                cursor.setPosition(position + len(visible_text[i]), QTextCursor.KeepAnchor)
-                char_format = self.currentCharFormat()
-                char_format.setForeground(QColor("black"))
-                cursor.setCharFormat(char_format)
-                self.document().findBlockByLineNumber(i).setUserState(0)  # Add flag to denote that this line number is writeable
-            position += len(visible_text[i])
-
-        current_cursor.endEditBlock()
-        self.document().clearUndoRedoStacks()
-
-    def _alter_read_write(self):
-        """Alters the read/write permissions for the text editor based on the
-        current position"""
-        is_ro = self._evaluate_is_readonly()
-        if is_ro:
-            self.setReadOnly(True)
-            self.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse | QtCore.Qt.TextSelectableByKeyboard)
+                doc.redo(cursor)
+        self.setTextCursor(cursor)
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Undo) or event.matches(QKeySequence.Redo):
+            event.accept()
+            self._undo_redo(event.matches(QKeySequence.Redo))
+            return
+        if event.matches(QKeySequence.Cut) or event.matches(QKeySequence.Paste):
+            protected = self._is_edit_protected()
+        elif event.matches(QKeySequence.DeleteCompleteLine):
+            cursor = self.textCursor()
+            protected = self._is_range_protected(cursor.block().position(), cursor.block().position() + cursor.block().length())
+        elif event.key() in (QtCore.Qt.Key_Backspace, QtCore.Qt.Key_Delete):
+            word = event.modifiers() & QtCore.Qt.ControlModifier
+            if event.key() == QtCore.Qt.Key_Backspace:
+                protected = self._is_edit_protected(QTextCursor.PreviousWord if word else QTextCursor.PreviousCharacter)
+            else:
+                protected = self._is_edit_protected(QTextCursor.NextWord if word else QTextCursor.NextCharacter)
         else:
-            self.setReadOnly(False)
+            for key, move_op in self.k_delete_keys:
+                if event.matches(key):
+                    protected = self._is_edit_protected(move_op)
+                    break
+            else:
+                # Any other key changes the text if it types a character or a line break
+                typed = event.key() in (QtCore.Qt.Key_Return, QtCore.Qt.Key_Enter) or \
+                    (event.text() and event.text().isprintable() or event.text() == '\t') and \
+                    not event.modifiers() & (QtCore.Qt.ControlModifier | QtCore.Qt.AltModifier | QtCore.Qt.MetaModifier)
+                protected = typed and self._is_edit_protected()
+        if protected:
+            event.accept()
+            return
+        super(ConstrainedTextEdit, self).keyPressEvent(event)
+
+    def inputMethodEvent(self, event):
+        if event.commitString() and self._is_edit_protected():
+            event.accept()
+            return
+        super(ConstrainedTextEdit, self).inputMethodEvent(event)
+
+    def insertFromMimeData(self, source):
+        if not self._is_edit_protected():
+            super(ConstrainedTextEdit, self).insertFromMimeData(source)
+
+    def dropEvent(self, event):
+        # Text dragged out of read only lines may only be copied, never moved
+        if event.source() is self and self._is_edit_protected():
+            event.setDropAction(QtCore.Qt.CopyAction)
+        super(ConstrainedTextEdit, self).dropEvent(event)
+
+    def cut(self):
+        if not self._is_edit_protected():
+            super(ConstrainedTextEdit, self).cut()
+
+    def paste(self):
+        if not self._is_edit_protected():
+            super(ConstrainedTextEdit, self).paste()
+
+    def contextMenuEvent(self, event):
+        menu = self.createStandardContextMenu(event.pos())
+        for action in menu.actions():
+            # Route undo and redo through the read only line check
+            if action.objectName() == 'edit-undo':
+                action.triggered.disconnect()
+                action.triggered.connect(self.undo)
+            elif action.objectName() == 'edit-redo':
+                action.triggered.disconnect()
+                action.triggered.connect(self.redo)
+        if self._is_edit_protected():
+            for action in menu.actions():
+                if action.objectName() in ('edit-cut', 'edit-paste', 'edit-delete'):
+                    action.setEnabled(False)
+        menu.exec_(event.globalPos())
+        menu.deleteLater()
 
     def _evaluate_is_readonly(self):
         """Protected method: Evaluates if the current position of the editor is
         readonly"""
-        block = self.textCursor().block()
-        if block.userState() == 1:
-            return True
-        else:
-            return False
+        return self._is_block_protected(self.textCursor().block())
+
+
+class ReloadUndoSteps(QtCore.QObject):
+    """Line states of the lines changed by the reloads of a document, kept as a child of the document so they stay
+    with it when it is moved between editors (see ConstrainedTextEdit.apply_rendered_diff)"""
+
+    def __init__(self, document):
+        super(ReloadUndoSteps, self).__init__(document)
+        self.steps = {}
+
+
+class ConstrainedTextHighlighter(QSyntaxHighlighter):
+    """Colors the lines of a constrained text document according to the line state
+    flags stored in the user state of each text block"""
+
+    def __init__(self, document):
+        super(ConstrainedTextHighlighter, self).__init__(document)
+        self._map_format = QTextCharFormat()
+        self._map_format.setForeground(QColor("blue"))
+
+    def highlightBlock(self, text):
+        state = self.currentBlockState()
+        if state > 0 and state & ConstrainedTextEdit.k_state_map_bit:
+            self.setFormat(0, len(text), self._map_format)
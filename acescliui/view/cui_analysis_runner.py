@@ -1,11 +1,14 @@
 import os
 import abc
+import logging
+from collections import OrderedDict
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QMessageBox
 
-from ..model.table_model import TableModel
+from ..model.table_model import KeyedTableModel
 from ..core.job_manager import JobManager
+from ..core.render_thread import CancellationToken, ConstrainedTextRenderThread
 
 
 class CuiAnalysisRunner(QtWidgets.QMainWindow):
@@ -21,16 +24,40 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
 
     KEEP_STR = 'KEEP'
 
+    # Maximum number of times per second the jobs table is repainted for job status changes
+    JOBS_TABLE_UPDATE_RATE = 10
+
+    # Limits of the cache of prepared text editor documents of recently viewed jobs
+    DOC_CACHE_MAX_JOBS = 10
+    DOC_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    DOC_CACHE_BYTES_PER_CHAR = 16  # Rough memory use of a document per character including its layout
+
+    # Idle time prefetch of the documents of the jobs next to the selected one
+    PREFETCH_DELAY_MS = 300  # Time the selection must stay on a job before its neighbours are prefetched
+    PREFETCH_ROWS = 1  # Number of rows above and below the selected row to prefetch
+
     prj_path = os.path.join(os.path.split(__file__)[0])+"/.."
 
-    def __init__(self, jobs_root=None, parent=None, window_title='Aces Model Editor'):
+    def __init__(self, jobs_root=None, parent=None, window_title='Aces Model Editor', job_registry_path=None):
         super(CuiAnalysisRunner, self).__init__(parent)
-        self._job_mgr = JobManager(jobs_root)
+        self._job_mgr = JobManager(jobs_root, registry_path=job_registry_path)
         self._text_eds = []  # List of text editors that are hosted by the tab widget
         self._active_ed_indx = -1  # Tracks the tab index of the currently active text editor
         self._active_job_id = None
         self._kept_job_id = None
+        self._doc_cache = OrderedDict()  # Detached editor documents by (job id, tab index), least recently used first
+        self._doc_cache_bytes = 0
+        self._ed_job_ids = []  # Job id whose document each text editor currently shows
+        self._job_doc_tabs = []  # Whether each text editor shows a document of the selected job that may be cached
+        self._prefetch_queue = []  # (job id, tab index, constrained text) still to be prefetched
+        self._prefetch_token = None
+        self._prefetch_thread = None
+        self._prefetch_job_id = None  # Job id of the document being prefetched
+        self._prefetch_timer = QtCore.QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.timeout.connect(self._start_prefetch)
         self._init_ui()
+        self._add_registered_jobs()
 
         # Set main window title
         _translate = QtCore.QCoreApplication.translate
@@ -43,16 +70,30 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
     def _init_jobs_table(self):
         hdrs = ['Analysis Id', 'Model Id', 'Status', 'Keep']
         data = []
-        self._jobs_table_model = TableModel(data, hdrs)
+        self._jobs_table_model = KeyedTableModel(data, hdrs, key_column=self.CLM_ID)
+        self._jobs_table_model.set_max_update_rate(self.JOBS_TABLE_UPDATE_RATE)
         self.tableJobs.setModel(self._jobs_table_model)
         self.tableJobs.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self._table_jobs_select_model = self.tableJobs.selectionModel()
         self._table_jobs_select_model.selectionChanged.connect(self._change_selected_job)
 
-    def _init_text_edit_tabs(self, text_editors, tab_titles):
+    def _init_text_edit_tabs(self, text_editors, tab_titles, job_doc_tabs=None):
+        """
+        Adds a tab for each text editor
+        :param text_editors: list of editor widgets, ConstrainedTextEdit or MappedFileView for large read only files
+        :param tab_titles: list of tab titles
+        :param job_doc_tabs: list of bools marking the ConstrainedTextEdit editors that are loaded with a document of
+         the selected job on every job change (see _selected_job_changed).  Only the documents of these editors are
+         cached and prefetched, by default none are.
+        :return: none
+        """
 
         if len(text_editors) != len(tab_titles):
             raise Exception('Length of text_editors and tab_titles lists are not equal')
+        if job_doc_tabs is None:
+            job_doc_tabs = [False] * len(text_editors)
+        elif len(job_doc_tabs) != len(text_editors):
+            raise Exception('Length of text_editors and job_doc_tabs lists are not equal')
 
         _translate = QtCore.QCoreApplication.translate
 
@@ -69,6 +110,8 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
             newTabLay.addWidget(text_editors[i])
             newTabWig.setLayout(newTabLay)
             self._text_eds.append(text_editors[i])
+            self._ed_job_ids.append(None)
+            self._job_doc_tabs.append(bool(job_doc_tabs[i]) and hasattr(text_editors[i], 'detach_document'))
             self.tabFiles.addTab(newTabWig, _translate('CuiAnalysisRunner', tab_titles[i]))
 
         self.tabFiles.setCurrentIndex(0)
@@ -277,6 +320,14 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
                                 QMessageBox.Yes | QMessageBox.No, QMessageBox.No) == QMessageBox.Yes:
             ok_to_close = self._prepare_to_close()
             if ok_to_close:
+                # Lets the job manager stop its background work so exiting does not wait for it
+                self._cancel_prefetch()
+                try:
+                    self._job_mgr.close()
+                except Exception as e:
+                    logging.exception(' Failed to save the analysis jobs')
+                    QMessageBox.warning(self, 'Cannot Save Analyses',
+                                        'Some analysis changes could not be saved:\n{0}'.format(e))
                 event.accept()
             else:
                 event.ignore()
@@ -323,8 +374,14 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
             job_id = self._get_job_id_for_table_row(indexes[0].row())
         else:
             job_id = None
+        self._cancel_prefetch()
+        if job_id != self._active_job_id:
+            self._swap_job_documents(self._active_job_id, job_id)
         self._selected_job_changed(self._active_job_id, job_id)
         self._active_job_id = job_id
+        self._ed_job_ids = [job_id if job_doc else None for job_doc in self._job_doc_tabs]
+        if job_id is not None:
+            self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
 
     def _select_row_for_job_id(self, job_id):
         """
@@ -342,18 +399,10 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
         :param job_id:
         :return: selected row number
         """
-        row = None
-        for r in range(self._jobs_table_model.rowCount()):
-            jid = self._get_job_id_for_table_row(r)
-            if jid == job_id:
-                row = r
-                break
-        return row
+        return self._jobs_table_model.row_for_key(job_id)
 
     def _get_job_id_for_table_row(self, row):
-        id_index = self._jobs_table_model.createIndex(row, self.CLM_ID)
-        job_id = self._jobs_table_model.data(id_index, role=QtCore.Qt.DisplayRole).value()
-        return job_id
+        return self._jobs_table_model.key_for_row(row)
 
     def _get_job_data_for_table(self, job_id):
 
@@ -361,34 +410,47 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
         if job_id == self._get_kept_job_id():
             kept = self.KEEP_STR
 
-        job_data = self._job_mgr.get_job_data(job_id)
         job_status = self._job_mgr.get_job_status(job_id)
 
         tbl_data = [
             job_id,
-            job_data['model']['id'],
+            self._job_mgr.get_job_model_id(job_id),
             job_status,
             kept
         ]
         return tbl_data
 
+    def _add_registered_jobs(self):
+        """
+        Adds the jobs restored by the job manager from its registry (see JobManager) to the jobs table
+        :return: nothing
+        """
+        job_ids = self._job_mgr.get_job_ids()
+        if job_ids:
+            self._jobs_table_model.add_data_items([self._get_job_data_for_table(j) for j in job_ids])
+
     def _refresh_table_item(self, job_id):
 
-        row = self._get_table_row_for_job_id(job_id)
         tbl_data = self._get_job_data_for_table(job_id)
+        if tbl_data[self.CLM_STATUS] != self._jobs_table_model.value(job_id, self.CLM_STATUS):
+            self._invalidate_job_documents(job_id)
 
-        # Job status
-        indx = self._jobs_table_model.createIndex(row, self.CLM_STATUS)
-        self._jobs_table_model.setData(indx, tbl_data[self.CLM_STATUS])
-
-        # Kept status
-        indx = self._jobs_table_model.createIndex(row, self.CLM_KEEP)
-        self._jobs_table_model.setData(indx, tbl_data[self.CLM_KEEP])
+        # Job status and kept status
+        self._jobs_table_model.update_values([
+            (job_id, self.CLM_STATUS, tbl_data[self.CLM_STATUS]),
+            (job_id, self.CLM_KEEP, tbl_data[self.CLM_KEEP]),
+        ])
 
     def _refresh_all_table_items(self):
+        key_values = []
         for r in range(self._jobs_table_model.rowCount()):
             id = self._get_job_id_for_table_row(r)
-            self._refresh_table_item(id)
+            tbl_data = self._get_job_data_for_table(id)
+            if tbl_data[self.CLM_STATUS] != self._jobs_table_model.value(id, self.CLM_STATUS):
+                self._invalidate_job_documents(id)
+            key_values.append((id, self.CLM_STATUS, tbl_data[self.CLM_STATUS]))
+            key_values.append((id, self.CLM_KEEP, tbl_data[self.CLM_KEEP]))
+        self._jobs_table_model.update_values(key_values)
 
     def _clone_selected_job(self):
         if self.tableJobs.selectedIndexes():
@@ -400,6 +462,7 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
     def _run_selected_job(self):
         if self.tableJobs.selectedIndexes():
             job_id = self._get_job_id_for_table_row(self.tableJobs.selectedIndexes()[0].row())
+            self._invalidate_job_documents(job_id)
             self._run_job(job_id)
         else:
             QtWidgets.QMessageBox.information(self, 'Cannot Run Analysis', 'No analysis has been selected to run.')
@@ -425,6 +488,7 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
             if self.tableJobs.selectedIndexes():
                 job_id = self._jobs_table_model.data(self.tableJobs.selectedIndexes()[0], role=QtCore.Qt.DisplayRole).value()
                 self._active_job_id = None
+                self._invalidate_job_documents(job_id)
                 self._jobs_table_model.remove_data_item(self.tableJobs.selectedIndexes()[0].row())
                 self._job_mgr.delete_job(job_id)
             else:
@@ -432,9 +496,146 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
 
     def _clear_jobs(self):
         self._active_job_id = None
+        self._cancel_prefetch()
+        self._doc_cache.clear()
+        self._doc_cache_bytes = 0
+        self._ed_job_ids = [None] * len(self._text_eds)
         self._jobs_table_model.remove_all_data_items()
         self._job_mgr.delete_all_jobs()
 
+    # ---------------------------------
+    # Editor Document Cache
+    # ---------------------------------
+
+    def _swap_job_documents(self, from_job_id, to_job_id):
+        """
+        Moves the documents of the previously selected job from the text editors into the document cache and
+        shows the cached documents of the newly selected job, if any.
+        :param from_job_id: previously selected job id
+        :param to_job_id: newly selected job id
+        :return: nothing
+        """
+        for i, ed in enumerate(self._text_eds):
+            if not self._job_doc_tabs[i]:
+                continue
+            if from_job_id and self._ed_job_ids[i] == from_job_id and not ed.is_loading():
+                self._cache_document(from_job_id, i, ed.detach_document())
+            doc = self._take_cached_document(to_job_id, i)
+            if doc:
+                ed.attach_document(doc)
+                self._ed_job_ids[i] = to_job_id
+            else:
+                self._ed_job_ids[i] = None
+
+    def _editor_shows_job(self, tab_indx, job_id):
+        """
+        Returns true if the text editor of the tab already shows the document of the job, e.g. because it was restored
+        from the document cache.  Subclasses should check this in _selected_job_changed to skip re-rendering.
+        :param tab_indx:
+        :param job_id:
+        :return: bool
+        """
+        return job_id is not None and self._ed_job_ids[tab_indx] == job_id
+
+    def _cache_document(self, job_id, tab_indx, doc):
+        key = (job_id, tab_indx)
+        if key in self._doc_cache:
+            self._doc_cache_bytes -= self._doc_cache.pop(key)[1]
+        n_bytes = doc.characterCount() * self.DOC_CACHE_BYTES_PER_CHAR
+        self._doc_cache[key] = (doc, n_bytes)
+        self._doc_cache_bytes += n_bytes
+
+        # Evict the least recently used documents
+        max_docs = self.DOC_CACHE_MAX_JOBS * max(len(self._text_eds), 1)
+        while self._doc_cache and (len(self._doc_cache) > max_docs or self._doc_cache_bytes > self.DOC_CACHE_MAX_BYTES):
+            old_doc, old_bytes = self._doc_cache.popitem(last=False)[1]
+            self._doc_cache_bytes -= old_bytes
+            old_doc.deleteLater()
+
+    def _take_cached_document(self, job_id, tab_indx):
+        entry = self._doc_cache.pop((job_id, tab_indx), None)
+        if entry is None:
+            return None
+        self._doc_cache_bytes -= entry[1]
+        return entry[0]
+
+    def _invalidate_job_documents(self, job_id):
+        """
+        Drops the cached documents of a job, must be called when the files shown for a job change so that they are
+        rendered again the next time the job is selected.  Called when a job is run and when its status changes.
+        :param job_id:
+        :return: nothing
+        """
+        if self._prefetch_job_id == job_id or any(p[0] == job_id for p in self._prefetch_queue):
+            self._cancel_prefetch()
+        for i in range(len(self._text_eds)):
+            doc = self._take_cached_document(job_id, i)
+            if doc:
+                doc.deleteLater()
+            if self._ed_job_ids[i] == job_id:
+                self._ed_job_ids[i] = None
+
+    # ---------------------------------
+    # Neighbouring Job Prefetch
+    # ---------------------------------
+
+    def _start_prefetch(self):
+        """
+        Queues the documents of the jobs in the rows next to the selected job that are not cached yet and renders
+        them one after the other on a low priority thread
+        :return: nothing
+        """
+        self._cancel_prefetch()
+        row = self._get_table_row_for_job_id(self._active_job_id)
+        if row is None:
+            return
+        for offset in range(1, self.PREFETCH_ROWS + 1):
+            for r in (row + offset, row - offset):
+                if r < 0 or r >= self._jobs_table_model.rowCount():
+                    continue
+                job_id = self._get_job_id_for_table_row(r)
+                for i, ed in enumerate(self._text_eds):
+                    if not self._job_doc_tabs[i] or (job_id, i) in self._doc_cache:
+                        continue
+                    constrained_text = self._job_constrained_text(job_id, i)
+                    if constrained_text is not None and constrained_text.can_render():
+                        self._prefetch_queue.append((job_id, i, constrained_text.copy()))
+        self._prefetch_token = CancellationToken()
+        self._prefetch_next()
+
+    def _prefetch_next(self):
+        if self._prefetch_thread or not self._prefetch_queue or self._prefetch_token is None:
+            return
+        job_id, tab_indx, constrained_text = self._prefetch_queue.pop(0)
+        token = self._prefetch_token
+        thread = ConstrainedTextRenderThread(constrained_text, token)
+        thread.notify_render_complete.connect(
+            lambda tkn, rendered: self._prefetch_complete(tkn, job_id, tab_indx, rendered))
+        thread.finished.connect(self._prefetch_thread_finished)
+        self._prefetch_thread = thread
+        self._prefetch_job_id = job_id
+        thread.start(QtCore.QThread.LowPriority)
+
+    def _prefetch_complete(self, token, job_id, tab_indx, rendered):
+        if token.cancelled or token is not self._prefetch_token:
+            return
+        self._cache_document(job_id, tab_indx, self._text_eds[tab_indx].create_document(rendered))
+
+    def _prefetch_thread_finished(self):
+        self._prefetch_thread = None
+        self._prefetch_job_id = None
+        self._prefetch_next()
+
+    def _cancel_prefetch(self):
+        """
+        Stops prefetching, the render in progress (if any) finishes but its result is dropped
+        :return: nothing
+        """
+        self._prefetch_timer.stop()
+        self._prefetch_queue = []
+        if self._prefetch_token:
+            self._prefetch_token.cancel()
+            self._prefetch_token = None
 
     # ---------------------------------
     # Must Inherit Methods
@@ -490,9 +691,22 @@ class CuiAnalysisRunner(QtWidgets.QMainWindow):
 
     def _selected_job_changed(self, from_job_id, to_job_id):
         """
-        Overrideble base class method to be notified of changes in the selected job.  Base class method does nothing
+        Overrideble base class method to be notified of changes in the selected job.  Text editors for which
+        _editor_shows_job returns true already show the cached document of the newly selected job and do not
+        need to be loaded again.  Base class method does nothing
         :param from_job_id:
         :param to_job_id:
         :return: nothing
         """
         pass
+
+    def _job_constrained_text(self, job_id, tab_indx):
+        """
+        Overrideble base class method returning the constrained text shown for the job in the text editor of the
+        tab, used to prefetch the documents of the jobs next to the selected one.  Base class method returns None,
+        which disables prefetching
+        :param job_id:
+        :param tab_indx:
+        :return: ConstrainedText or None
+        """
+        return None
@@ -6,7 +6,9 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QMessageBox
 
 from ..model.tree_model import TreeModel
-from ..model.table_model import TableModel
+from ..model.dict_table_model import DictTableModel
+from ..core.constrained_text import ConstrainedText
+from ..core.parameter_index_thread import ParameterIndexThread
 
 
 class CuiModelEditor(QtWidgets.QMainWindow):
@@ -20,10 +22,15 @@ class CuiModelEditor(QtWidgets.QMainWindow):
 
     prj_path = os.path.join(os.path.split(__file__)[0])+"/.."
 
-    def __init__(self, parent=None, window_title='Aces Model Editor', has_read_only_inputs=True):
+    def __init__(self, parent=None, window_title='Aces Model Editor', has_read_only_inputs=True, template_cache_dir=None):
         super(CuiModelEditor, self).__init__(parent)
+        if template_cache_dir:
+            ConstrainedText.set_bytecode_cache_dir(template_cache_dir)  # Reuse compiled templates from earlier sessions
         self._ro_input_data = {}
-        self.__input_map_kwds = []
+        self._ro_search_indexes = {}  # Parameter name search index of each read only data set
+        self._ro_index_threads = {}  # Thread building the search index of each read only data set
+        self.__index_threads = []  # Keeps index threads alive until they finish
+        self.__input_map_kwds = frozenset()
         self.__changesSaved = True
         self.__text_eds = []  # List of text editors that are hosted by the tab widget
         self.__active_ed_indx = -1  # Tracks the tab index of the currently active text editor
@@ -42,7 +49,8 @@ class CuiModelEditor(QtWidgets.QMainWindow):
 
     def _init_ro_table_ui(self):
         self._ro_table_hdrs = ['Parameter', 'Value', 'Units', 'Mapped']
-        mdl = TableModel([], self._ro_table_hdrs)
+        self._ro_table_fields = ['value', 'units', 'mapped']  # Read only input fields shown after the parameter name
+        mdl = DictTableModel({}, self._ro_table_hdrs, self._ro_table_fields)
         self.tblViewReadOnlyInpts.setModel(mdl)
         self.tblViewReadOnlyInpts.setColumnWidth(1, 900)
         self.tblViewReadOnlyInpts.horizontalHeader().setStretchLastSection(False)
@@ -201,12 +209,29 @@ class CuiModelEditor(QtWidgets.QMainWindow):
             self.cmbReadOnly.setMaximumSize(QtCore.QSize(200, QtWidgets.QWIDGETSIZE_MAX))
             self.cmbReadOnly.currentIndexChanged.connect(self._combo_box_index_changed)
 
-            # Horizontal layout to hold read only label and combo
+            # Read only inputs parameter name filter
+            self.txtReadOnlyFilter = QtWidgets.QLineEdit()
+            self.txtReadOnlyFilter.setObjectName("txtReadOnlyFilter")
+            self.txtReadOnlyFilter.setMinimumSize(QtCore.QSize(300, 0))
+            self.txtReadOnlyFilter.setClearButtonEnabled(True)
+            self.txtReadOnlyFilter.textChanged.connect(self._filter_readonly_inputs)
+
+            # Read only inputs mapped state filter
+            self.cmbReadOnlyMapped = QtWidgets.QComboBox()
+            self.cmbReadOnlyMapped.setObjectName("cmbReadOnlyMapped")
+            self.cmbReadOnlyMapped.addItem("All")
+            self.cmbReadOnlyMapped.addItem("Mapped", userData='YES')
+            self.cmbReadOnlyMapped.addItem("Unmapped", userData='NO')
+            self.cmbReadOnlyMapped.currentIndexChanged.connect(self._filter_readonly_inputs)
+
+            # Horizontal layout to hold read only label, combo and filters
             self.horizLayoutReadOnlyLable = QtWidgets.QHBoxLayout()
             self.horizLayoutReadOnlyLable.setObjectName("horizLayoutReadOnlyLable")
             self.horizLayoutReadOnlyLable.addWidget(self.labelReadOnly)
             self.horizLayoutReadOnlyLable.addWidget(self.cmbReadOnly)
-            self.horizLayoutReadOnlyLable.addSpacing(800)
+            self.horizLayoutReadOnlyLable.addWidget(self.txtReadOnlyFilter)
+            self.horizLayoutReadOnlyLable.addWidget(self.cmbReadOnlyMapped)
+            self.horizLayoutReadOnlyLable.addStretch()
 
             # Read only inputs table view
             self.tblViewReadOnlyInpts = QtWidgets.QTableView()
@@ -256,6 +281,9 @@ class CuiModelEditor(QtWidgets.QMainWindow):
         if has_read_only_inputs:
             self.labelReadOnly.setText(_translate("CuiModelEditor", "Mapped Read Only Inputs"))
             self.cmbReadOnly.setToolTip(_translate("CuiAnalysisRunner", 'Select which input data set to view in the table below'))
+            self.txtReadOnlyFilter.setPlaceholderText(_translate("CuiModelEditor", 'Filter parameters, e.g. DISCIP.SAS.*.40'))
+            self.txtReadOnlyFilter.setToolTip(_translate("CuiModelEditor", 'Shows the parameters starting with the dot separated name segments, * matches any segment'))
+            self.cmbReadOnlyMapped.setToolTip(_translate("CuiModelEditor", 'Filter the parameters by their mapped state'))
 
     def _add_widget_to_grid_layout(self, wig, row, column, alignment=QtCore.Qt.AlignCenter):
         """
@@ -365,51 +393,111 @@ class CuiModelEditor(QtWidgets.QMainWindow):
 
     def _add_readonly_inputs(self, input_data, ro_item_key, ro_combo_text):
         self._ro_input_data[ro_item_key] = input_data
+        self._ro_search_indexes.pop(ro_item_key, None)
+        self._ro_index_threads.pop(ro_item_key, None)
         self.cmbReadOnly.addItem(ro_combo_text, userData=ro_item_key)
 
     def _clear_readonly_inputs(self):
         self._ro_input_data.clear()
+        self._ro_search_indexes.clear()
+        self._ro_index_threads.clear()
         for i in range(1, self.cmbReadOnly.count()):
             self.cmbReadOnly.removeItem(self.cmbReadOnly.count()-1)
 
     def _set_readonly_input_mapped_state(self):
         try:
+            ro_key = self.cmbReadOnly.currentData()
+            changed_keys = []
             for kk, ii in self._ro_input_data.items():
                 for k, i in ii.items():
                     mapped = 'YES' if k in self.__input_map_kwds else 'NO'
-                    i['mapped'] = mapped
-            ro_key = self.cmbReadOnly.currentData()
-
-            # Find the data in the read only model and change the mapping
-            mdl = self.tblViewReadOnlyInpts.model()
-            strt_idx = mdl.createIndex(0, self.CLM_PARAM)
-            if ro_key in self._ro_input_data:
-                for k, i in self._ro_input_data[ro_key].items():
-                    indxs = mdl.match(strt_idx, QtCore.Qt.DisplayRole, k, 1)
-                    if len(indxs) == 1:
-                        data_idx = mdl.createIndex(indxs[0].row(), self.CLM_MAP)
-                        self.tblViewReadOnlyInpts.model().setData(data_idx, i['mapped'], QtCore.Qt.EditRole)
+                    if i.get('mapped') != mapped:
+                        i['mapped'] = mapped
+                        if kk == ro_key:
+                            changed_keys.append(k)
+
+            # The read only model shows the inputs in place, only notify it of the rows whose mapping flipped
+            if changed_keys:
+                if self.cmbReadOnlyMapped.currentData():
+                    self._filter_readonly_inputs()
+                else:
+                    self.tblViewReadOnlyInpts.model().items_changed(changed_keys, self.CLM_MAP)
         except AttributeError:
             logging.exception(' Non fatal attribute error raised')
 
     def _set_readonly_table_model(self, ro_key):
         try:
-            if not ro_key in self._ro_input_data:
-                mdl = TableModel([], self._ro_table_hdrs)
-                self.tblViewReadOnlyInpts.setModel(mdl)
-            else:
-                data_dict = self._ro_input_data[ro_key]
-                ro_model = []
-                for k, i in data_dict.items():
-                    itm = [k, i['value'], i['units'], i['mapped']]
-                    ro_model.append(itm)
-                mdl = TableModel(ro_model, self._ro_table_hdrs)
-                self.tblViewReadOnlyInpts.setModel(mdl)
+            # The model reads the inputs in place and the view fetches rows as they are scrolled into view
+            data_dict = self._ro_input_data.get(ro_key, {})
+            mdl = DictTableModel(data_dict, self._ro_table_hdrs, self._ro_table_fields)
+            self.tblViewReadOnlyInpts.setModel(mdl)
+            self._build_readonly_search_index(ro_key)
+            self._filter_readonly_inputs()
         except AttributeError:
             logging.exception(' Non fatal attribute error raised')
 
+    def _build_readonly_search_index(self, ro_key):
+        """
+        Starts building the parameter name search index of a read only data set in the background, if it is not
+        built or being built yet
+        :param ro_key: read only data set key
+        :return: nothing
+        """
+        if ro_key not in self._ro_input_data or ro_key in self._ro_search_indexes or ro_key in self._ro_index_threads:
+            return
+        thread = ParameterIndexThread(list(self._ro_input_data[ro_key]))
+        thread.notify_index_complete.connect(
+            lambda thrd, index: self._readonly_search_index_built(ro_key, thrd, index))
+        self._ro_index_threads[ro_key] = thread
+        self.__index_threads.append(thread)
+        thread.finished.connect(self.__index_thread_finished)
+        thread.start(QtCore.QThread.LowPriority)
+
+    def _readonly_search_index_built(self, ro_key, thread, index):
+        if self._ro_index_threads.get(ro_key) is not thread:
+            return  # The data set was replaced or cleared while its index was built
+        del self._ro_index_threads[ro_key]
+        self._ro_search_indexes[ro_key] = index
+        if ro_key == self.cmbReadOnly.currentData() and self.txtReadOnlyFilter.text().strip():
+            self._filter_readonly_inputs()
+
+    def __index_thread_finished(self):
+        self.__index_threads = [t for t in self.__index_threads if not t.isFinished()]
+
+    def _filter_readonly_inputs(self):
+        """
+        Restricts the read only inputs table to the parameters matching the name filter and mapped state filter,
+        the names are looked up in the search index of the data set instead of scanning all the rows.  While the
+        index is still being built the table is left as is, it is filtered once the index is ready.
+        :return: nothing
+        """
+        ro_key = self.cmbReadOnly.currentData()
+        mdl = self.tblViewReadOnlyInpts.model()
+        pattern = self.txtReadOnlyFilter.text()
+        mapped = self.cmbReadOnlyMapped.currentData()
+        if ro_key not in self._ro_input_data or (not pattern.strip() and mapped is None):
+            mdl.set_key_filter(None)
+            return
+
+        data_dict = self._ro_input_data[ro_key]
+        if pattern.strip():
+            if ro_key not in self._ro_search_indexes:
+                self._build_readonly_search_index(ro_key)
+                return
+            keys = self._ro_search_indexes[ro_key].search(pattern)
+        else:
+            keys = data_dict
+        if mapped is not None:
+            keys = [k for k in keys if data_dict[k].get('mapped', '') == mapped]
+        mdl.set_key_filter(keys)
+
     def _update_template_keywords(self, kwds):
-        self.__input_map_kwds = kwds
+        """
+        Sets the keywords used by the template(s), e.g. from ConstrainedText.template_keywords
+        :param kwds: iterable of keyword names
+        :return: nothing
+        """
+        self.__input_map_kwds = frozenset(kwds)
 
     def contextMenuEvent(self, event: QtGui.QContextMenuEvent):
         self._show_read_only_input_context_menu(event)
@@ -0,0 +1,170 @@
+"""
+    :author:
+        PG GT EN LGT MT DA,
+        Siemens Energy,
+        Orlando - FL
+"""
+
+# System imports
+import mmap
+from array import array
+
+# PyQt imports
+from PyQt5.QtWidgets import QAbstractScrollArea
+from PyQt5.QtGui import QFont, QFontMetrics, QPainter
+
+# My imports
+from ..core.line_index_thread import LineIndexThread
+
+
+class MappedFileView(QAbstractScrollArea):
+    """Read only viewer for very large text files such as solver outputs.  The file is
+    memory mapped, a sparse line index is built in the background and only the lines in
+    view (plus a margin) are decoded, so opening a file takes the same time and memory
+    regardless of its size"""
+
+    k_index_stride = 64  # Lines between two indexed line offsets
+    k_window_margin = 256  # Lines decoded above and below the visible lines
+
+    def __init__(self, encoding='utf-8'):
+        super(MappedFileView, self).__init__(parent=None)
+        self.setFont(QFont("Courier 10 Pitch", 10, 60))
+        self._encoding = encoding
+        self._file = None
+        self._mm = None
+        self._index_thread = None
+        self._index = array('q')  # Byte offsets of every k_index_stride-th line
+        self._line_count = 0
+        self._index_complete = False
+        self._window_first = 0  # First line number of the decoded window
+        self._window = []  # Decoded lines around the visible lines
+        self._max_line_len = 0
+
+    def open_file(self, file_path):
+        """
+        Shows the given file, the lines become scrollable as the background index is built
+        :param file_path: path of the text file to show
+        :return: None
+        """
+        self.close_file()
+        self._file = open(file_path, 'rb')
+        if self._file.seek(0, 2) > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index = array('q', [0])
+
+        self._index_thread = LineIndexThread(file_path, self.k_index_stride)
+        self._index_thread.notify_index_progress.connect(self._index_progress)
+        self._index_thread.notify_index_complete.connect(self._index_completed)
+        self._index_thread.start()
+
+    def close_file(self):
+        if self._index_thread:
+            self._index_thread.cancel()
+            self._index_thread.wait()
+            self._index_thread = None
+        if self._mm:
+            self._mm.close()
+            self._mm = None
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._index = array('q')
+        self._line_count = 0
+        self._index_complete = False
+        self._window_first = 0
+        self._window = []
+        self._max_line_len = 0
+        self._update_scroll_bars()
+        self.viewport().update()
+
+    def isReadOnly(self):
+        return True
+
+    def line_count(self):
+        """Number of lines indexed so far"""
+        return self._line_count
+
+    def closeEvent(self, event):
+        self.close_file()
+        super(MappedFileView, self).closeEvent(event)
+
+    def _index_progress(self, thread, offsets, n_lines):
+        if thread is not self._index_thread:
+            return  # Queued before the file was closed or replaced
+        self._index.extend(offsets)
+        self._line_count = n_lines
+        self._update_scroll_bars()
+        self.viewport().update()
+
+    def _index_completed(self, thread, n_lines):
+        if thread is not self._index_thread:
+            return
+        self._line_count = n_lines
+        self._index_complete = True
+        self._update_scroll_bars()
+        self.viewport().update()
+
+    def _visible_line_count(self):
+        return self.viewport().height() // QFontMetrics(self.font()).lineSpacing() + 1
+
+    def _update_scroll_bars(self):
+        metrics = QFontMetrics(self.font())
+        self.verticalScrollBar().setPageStep(self._visible_line_count())
+        self.verticalScrollBar().setRange(0, max(0, self._line_count - self._visible_line_count() + 1))
+        self.horizontalScrollBar().setPageStep(self.viewport().width())
+        self.horizontalScrollBar().setSingleStep(metrics.averageCharWidth())
+        self.horizontalScrollBar().setRange(0, max(0, self._max_line_len * metrics.averageCharWidth() - self.viewport().width()))
+
+    def _get_lines(self, first, count):
+        """
+        Returns the decoded lines first to first + count, decoding a new window of lines around them if needed
+        """
+        last = min(first + count, self._line_count)
+        if first >= self._window_first and last <= self._window_first + len(self._window):
+            return self._window[first - self._window_first:last - self._window_first]
+
+        # Seek to the closest indexed line preceding the window and skip forward to its first line
+        window_first = max(first - self.k_window_margin, 0)
+        window_last = min(last + self.k_window_margin, self._line_count)
+        checkpoint = min(window_first // self.k_index_stride, len(self._index) - 1)
+        pos = self._index[checkpoint]
+        for i in range(checkpoint * self.k_index_stride, window_first):
+            pos = self._mm.find(b'\n', pos) + 1
+
+        window = []
+        for i in range(window_first, window_last):
+            end = self._mm.find(b'\n', pos)
+            if end < 0:
+                end = len(self._mm)
+            window.append(self._mm[pos:end].decode(self._encoding, errors='replace').rstrip('\r').expandtabs())
+            pos = end + 1
+        self._window_first = window_first
+        self._window = window
+
+        max_line_len = max([len(line) for line in window] + [self._max_line_len])
+        if max_line_len != self._max_line_len:
+            self._max_line_len = max_line_len
+            self._update_scroll_bars()
+        return self._window[first - window_first:last - window_first]
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.setFont(self.font())
+        painter.fillRect(event.rect(), self.palette().base())
+        if self._mm is None:
+            return
+
+        metrics = QFontMetrics(self.font())
+        first = self.verticalScrollBar().value()
+        x = -self.horizontalScrollBar().value()
+        y = metrics.ascent()
+        for line in self._get_lines(first, self._visible_line_count()):
+            painter.drawText(x, y, line)
+            y += metrics.lineSpacing()
+
+    def resizeEvent(self, event):
+        super(MappedFileView, self).resizeEvent(event)
+        self._update_scroll_bars()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
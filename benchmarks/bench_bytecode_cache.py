@@ -0,0 +1,74 @@
+"""
+Benchmark of the first render of a freshly started process with and without the on-disk jinja bytecode cache
+(ConstrainedText.set_bytecode_cache_dir).  Each start is a new python process so nothing is kept in memory between
+runs: "no cache" compiles the template, "cold cache" compiles it and writes the cache, "warm cache" loads the
+bytecode written by the previous run.
+
+Run from the repository root:  python benchmarks/bench_bytecode_cache.py [n_parameters]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from acescliui.core.constrained_text import ConstrainedText
+
+
+def make_template(n_params):
+    # Mapped values with some conditional and looping blocks, compiling is dominated by the number of expressions
+    lines = []
+    for i in range(n_params):
+        lines.append("  PARAM.{0:d} = {{{{ p_{0:d} }}}} {1:s}\n".format(i, ConstrainedText.k_tag_map))
+        if i % 20 == 0:
+            lines.append("{{% if p_{0:d} > 0.5 %}}\n  FLAG.{0:d} = ON {1:s}\n{{% endif %}}\n".format(
+                i, ConstrainedText.k_tag_ro))
+            lines.append("{{% for k in range(3) %}}\n  LOOP.{0:d}.{{{{ k }}}} = {{{{ p_{0:d} * k }}}}\n"
+                         "{{% endfor %}}\n".format(i))
+    return "".join(lines)
+
+
+def first_render(template_path, n_params, cache_dir):
+    """Child process: loads the template and renders it once, prints the time taken"""
+    start = time.perf_counter()
+    if cache_dir:
+        ConstrainedText.set_bytecode_cache_dir(cache_dir)
+    ct = ConstrainedText()
+    ct.get_template_from_file(template_path)
+    ct.get_mapped_data({'model': {'p_{0:d}'.format(i): {'value': i / n_params} for i in range(n_params)}})
+    ct.render_text()
+    print(time.perf_counter() - start)
+
+
+def run_child(template_path, n_params, cache_dir):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', template_path,
+                                      str(n_params), cache_dir or ''])
+    return float(output.decode().split()[-1])
+
+
+def main(n_params=5000, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_path = os.path.join(tmp_dir, 'template.txt')
+        with open(template_path, 'wt') as fout:
+            fout.write(make_template(n_params))
+
+        results = {'no cache': [], 'cold cache': [], 'warm cache': []}
+        for i in range(repeat):
+            cache_dir = os.path.join(tmp_dir, 'cache_{0:d}'.format(i))
+            results['no cache'].append(run_child(template_path, n_params, None))
+            results['cold cache'].append(run_child(template_path, n_params, cache_dir))
+            results['warm cache'].append(run_child(template_path, n_params, cache_dir))
+
+    print('first render of a {0:d} parameter template in a new process (best of {1:d})'.format(n_params, repeat))
+    for name, times in results.items():
+        print('{0:>12s} {1:9.1f}ms'.format(name, min(times) * 1e3))
+    print('{0:>12s} {1:9.1f}x'.format('speedup', min(results['no cache']) / min(results['warm cache'])))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        first_render(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,99 @@
+"""
+Benchmark of the job table model (KeyedTableModel) at 10k and 100k jobs shown in a table view: adding the jobs,
+looking up the row of every job id, updating the status of every job one at a time and a full refresh of all the
+jobs as done by CuiAnalysisRunner._refresh_all_table_items.  The time per job should stay flat as the table grows.
+For comparison the row lookup by scanning the rows of a TableModel is timed on a sample of job ids.  Runs without a
+display using the offscreen Qt platform unless QT_QPA_PLATFORM is already set.
+
+Run from the repository root:  python benchmarks/bench_job_table_model.py [n_jobs ...]
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QTableView
+
+from acescliui.model.table_model import TableModel, KeyedTableModel
+
+HDRS = ['Job ID', 'Model', 'Status', 'Keep']
+CLM_ID = 0
+CLM_STATUS = 2
+CLM_KEEP = 3
+N_SCAN_SAMPLE = 20
+
+
+def make_jobs(n_jobs):
+    return [[str(uuid.uuid4()), 'model_{0:d}'.format(i % 7), 'Created', False] for i in range(n_jobs)]
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def scan_row_for_job_id(model, job_id):
+    # Row lookup of the job table before it was keyed, reading each row through the model index
+    for r in range(model.rowCount()):
+        if model.data(model.createIndex(r, CLM_ID), Qt.DisplayRole).value() == job_id:
+            return r
+    return None
+
+
+def bench(app, n_jobs):
+    jobs = make_jobs(n_jobs)
+    job_ids = [j[CLM_ID] for j in jobs]
+    model = KeyedTableModel([], HDRS, key_column=CLM_ID)
+    view = QTableView()
+    view.setModel(model)
+    view.show()
+    app.processEvents()
+
+    def update_each():
+        for job_id in job_ids:
+            model.set_value(job_id, CLM_STATUS, 'Running')
+
+    def refresh_all():
+        key_values = []
+        for r in range(model.rowCount()):
+            job_id = model.key_for_row(r)
+            if model.value(job_id, CLM_STATUS) != 'Finished':
+                key_values.append((job_id, CLM_STATUS, 'Finished'))
+            key_values.append((job_id, CLM_KEEP, True))
+        model.update_values(key_values)
+
+    results = [
+        ('add', timed(lambda: model.add_data_items(jobs))),
+        ('lookup', timed(lambda: [model.row_for_key(job_id) for job_id in job_ids])),
+        ('update each', timed(update_each)),
+        ('refresh all', timed(refresh_all)),
+    ]
+    app.processEvents()
+    assert model.value(job_ids[-1], CLM_STATUS) == 'Finished'
+
+    scan_model = TableModel([list(j) for j in jobs], HDRS)
+    sample = job_ids[-N_SCAN_SAMPLE:]  # Worst case, the last rows
+    scan_time = timed(lambda: [scan_row_for_job_id(scan_model, job_id) for job_id in sample])
+    view.close()
+    return results, scan_time
+
+
+def main(sizes=(10000, 100000)):
+    app = QApplication.instance() or QApplication(sys.argv)
+    for n_jobs in sizes:
+        results, scan_time = bench(app, n_jobs)
+        print('{0:d} jobs'.format(n_jobs))
+        for name, elapsed in results:
+            print('  {0:>12s} {1:10.1f}ms {2:8.2f}us per job'.format(name, elapsed * 1e3, elapsed * 1e6 / n_jobs))
+        print('  {0:>12s} {1:10.1f}ms per job, {2:.0f}x the keyed lookup'.format(
+            'scan lookup', scan_time * 1e3 / N_SCAN_SAMPLE,
+            scan_time / N_SCAN_SAMPLE / (results[1][1] / n_jobs)))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or (10000, 100000))
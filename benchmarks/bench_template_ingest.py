@@ -0,0 +1,66 @@
+"""
+Benchmark of ConstrainedText template ingestion from a string, a file object and a file (read through a text buffer
+and memory mapped), for templates from 1k to 1M lines.  The time per line should stay flat as the template grows.
+
+Run from the repository root:  python benchmarks/bench_template_ingest.py [max_lines]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from acescliui.core.constrained_text import ConstrainedText
+
+
+def make_template(n_lines):
+    # One mapped line every ten lines, like a flow network deck
+    lines = []
+    for i in range(n_lines):
+        if i % 10 == 0:
+            lines.append("  FLOW.{0:d} = {{{{ flow_{0:d} }}}} {1:s}\n".format(i, ConstrainedText.k_tag_map))
+        else:
+            lines.append("  NODE {0:7d}  1.000E+00  2.500E+02  3.000E-01\n".format(i))
+    return "".join(lines)
+
+
+def time_call(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(max_lines=1000000):
+    print("{0:>9s} {1:>10s} {2:>16s} {3:>16s} {4:>16s} {5:>16s}".format(
+        "lines", "MB", "string", "fileobj", "file", "file mmap"))
+    n_lines = 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        while n_lines <= max_lines:
+            template = make_template(n_lines)
+            path = os.path.join(tmp_dir, "template_{0:d}.txt".format(n_lines))
+            with open(path, "wt") as fout:
+                fout.write(template)
+
+            def from_fileobj():
+                with open(path, "rt") as fin:
+                    ConstrainedText().get_template_from_fileobj(fin)
+
+            times = [
+                time_call(lambda: ConstrainedText().get_template_from_string(template)),
+                time_call(from_fileobj),
+                time_call(lambda: ConstrainedText().get_template_from_file(path, use_mmap=False)),
+                time_call(lambda: ConstrainedText().get_template_from_file(path, use_mmap=True)),
+            ]
+            cells = ["{0:7.1f}ms {1:4.2f}us".format(t * 1e3, t * 1e6 / n_lines) for t in times]
+            print("{0:9d} {1:10.1f} {2:s}".format(n_lines, len(template) / 1e6, " ".join(cells)))
+            n_lines *= 10
+    print("(each cell: best of 3 total time and time per line)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
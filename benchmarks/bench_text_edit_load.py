@@ -0,0 +1,58 @@
+"""
+Benchmark of ConstrainedTextEdit.load for documents of 1k to 100k lines mixing writeable, read only and mapped
+lines.  The time per line should stay flat as the document grows.  Runs without a display using the offscreen Qt
+platform unless QT_QPA_PLATFORM is already set.
+
+Run from the repository root:  python benchmarks/bench_text_edit_load.py [max_lines]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+from acescliui.core.constrained_text import ConstrainedText
+from acescliui.view.constrained_text_edit import ConstrainedTextEdit
+
+
+def make_constrained_text(n_lines):
+    tags = (ConstrainedText.k_tag_rw, ConstrainedText.k_tag_ro, ConstrainedText.k_tag_map, '')
+    lines = []
+    for i in range(n_lines):
+        if i % 4 == 2:
+            lines.append("  PARAM.{0:d} = {{{{ p_{0:d} }}}} {1:s}\n".format(i, tags[2]))
+        else:
+            lines.append("  LINE {0:7d}  1.000E+00  2.500E+02 {1:s}\n".format(i, tags[i % 4]))
+    ct = ConstrainedText()
+    ct.get_template_from_string("".join(lines))
+    ct.get_mapped_data({'model': {'p_{0:d}'.format(i): {'value': float(i)} for i in range(2, n_lines, 4)}})
+    ct.render_text()  # Compile the template up front so only the load is timed
+    return ct
+
+
+def main(max_lines=100000):
+    app = QApplication.instance() or QApplication(sys.argv)
+    print('{0:>9s} {1:>12s} {2:>12s}'.format('lines', 'load', 'per line'))
+    n_lines = 1000
+    while n_lines <= max_lines:
+        ct = make_constrained_text(n_lines)
+        editor = ConstrainedTextEdit()
+        editor.show()
+        start = time.perf_counter()
+        editor.load(ct)
+        app.processEvents()  # Includes any highlighting and layout done after load returns
+        elapsed = time.perf_counter() - start
+        if editor.document().blockCount() < n_lines:
+            raise Exception('Editor shows {0:d} of {1:d} lines'.format(editor.document().blockCount(), n_lines))
+        print('{0:9d} {1:10.1f}ms {2:10.2f}us'.format(n_lines, elapsed * 1e3, elapsed * 1e6 / n_lines))
+        editor.close()
+        editor.deleteLater()
+        app.processEvents()
+        n_lines *= 10
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,201 @@
+import copy
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+
+from acescliui.core.cow_dict import CowDict
+from acescliui.core.job_manager import JobManager
+
+
+class CopyCounter:
+    """
+    Mutable value counting how many times it was deep copied
+    """
+
+    copies = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __deepcopy__(self, memo):
+        CopyCounter.copies += 1
+        return CopyCounter(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, CopyCounter) and self.value == other.value
+
+
+def make_data():
+    return {
+        'model': {'id': 'M1', 'params': {'a': [1, 2], 'b': 2.0, 'c': {'units': 'm', 'values': (1, 2)}}},
+        'inputs': {'x': 1, 'y': {'z': [3, {'w': 4}]}},
+        'tags': {'t1', 't2'},
+    }
+
+
+class TestCowDictMatchesDeepcopy(unittest.TestCase):
+    """
+    A CowDict and its forks must behave as a dictionary and its deep copies
+    """
+
+    def test_fork_isolated_from_changes(self):
+        cow = CowDict(make_data())
+        plain = make_data()
+        cow_fork, plain_copy = cow.fork(), copy.deepcopy(plain)
+        for d in (cow, plain):
+            d['model']['params']['a'].append(3)
+            d['model']['params']['c']['units'] = 'mm'
+            del d['inputs']['y']
+            d['new'] = {'k': 'v'}
+        for d in (cow_fork, plain_copy):
+            d['model']['id'] = 'M2'
+            d['tags'].add('t3')
+        self.assertEqual(cow, plain)
+        self.assertEqual(cow_fork, plain_copy)
+        self.assertNotEqual(cow, cow_fork)
+
+    def test_held_reference_stays_live(self):
+        cow = CowDict(make_data())
+        params = cow['model']['params']
+        values = params['a']
+        cow_fork = cow.fork()
+        values.append(3)
+        params['b'] = 3.0
+        self.assertEqual(cow['model']['params']['a'], [1, 2, 3])
+        self.assertIs(cow['model']['params']['a'], values)
+        self.assertEqual(cow['model']['params']['b'], 3.0)
+        self.assertEqual(cow_fork['model']['params'], make_data()['model']['params'])
+        values.append(4)
+        self.assertEqual(cow.fork()['model']['params']['a'], [1, 2, 3, 4])
+        self.assertEqual(cow_fork['model']['params']['a'], [1, 2])
+
+    def test_fork_reference_does_not_leak_into_source(self):
+        cow = CowDict(make_data())
+        cow_fork = cow.fork()
+        values = cow_fork['inputs']['y']['z']
+        values[1]['w'] = 5
+        cow_fork['inputs']['y']['z'].append(6)
+        self.assertEqual(cow['inputs']['y']['z'], [3, {'w': 4}])
+        self.assertEqual(cow_fork['inputs']['y']['z'], [3, {'w': 5}, 6])
+
+    def test_random_operations(self):
+        rng = random.Random(42)
+        cows, plains = [CowDict(make_data())], [make_data()]
+        keys = ['a', 'b', 'c', 'x', 'y', 'z']
+
+        def pick_dict(cow, plain):
+            # Same path through both, returning the nested dictionaries reached
+            while rng.random() < 0.6:
+                nested = [k for k in plain if isinstance(plain[k], dict)]
+                if not nested:
+                    break
+                key = rng.choice(nested)
+                cow, plain = cow[key], plain[key]
+            return cow, plain
+
+        for _ in range(3000):
+            i = rng.randrange(len(cows))
+            cow, plain = pick_dict(cows[i], plains[i])
+            key = rng.choice(keys)
+            op = rng.random()
+            if op < 0.25:
+                value = rng.choice([rng.random(), [rng.random()], {'n': rng.random()}, 'text', None])
+                cow[key], plain[key] = copy.deepcopy(value), copy.deepcopy(value)
+            elif op < 0.35:
+                self.assertEqual(cow.pop(key, None), plain.pop(key, None))
+            elif op < 0.45:
+                if isinstance(plain.get(key), list):
+                    value = rng.random()
+                    cow[key].append(value)
+                    plain[key].append(value)
+            elif op < 0.55:
+                self.assertEqual(cow.setdefault(key, 0), plain.setdefault(key, 0))
+            elif op < 0.65 and len(cows) < 30:
+                cows.append(cows[i].fork())
+                plains.append(copy.deepcopy(plains[i]))
+            elif op < 0.7:
+                other = {k: rng.random() for k in rng.sample(keys, 2)}
+                cow.update(other)
+                plain.update(other)
+            elif op < 0.72:
+                cow.clear()
+                plain.clear()
+            else:
+                self.assertEqual(key in cow, key in plain)
+                self.assertEqual(len(cow), len(plain))
+                self.assertEqual(list(cow), list(plain))
+        for cow, plain in zip(cows, plains):
+            self.assertEqual(cow, plain)
+            self.assertEqual(cow.to_dict(), plain)
+            self.assertEqual(pickle.loads(pickle.dumps(cow)), plain)
+
+    def test_dict_interface(self):
+        cow = CowDict(make_data())
+        plain = make_data()
+        cow['inputs']['x'] = plain['inputs']['x'] = 7
+        del cow['tags'], plain['tags']
+        self.assertIsInstance(cow, dict)
+        self.assertEqual(len(cow), len(plain))
+        self.assertEqual(list(cow.keys()), list(plain.keys()))
+        self.assertEqual(list(reversed(cow)), list(reversed(plain)))
+        self.assertEqual(dict(cow['inputs'].items()), plain['inputs'])
+        self.assertEqual(list(cow['inputs'].values()), list(plain['inputs'].values()))
+        self.assertEqual(dict(cow), plain)
+        self.assertEqual(cow.popitem(), plain.popitem())
+        self.assertNotIn('tags', cow)
+        self.assertRaises(KeyError, cow.__getitem__, 'tags')
+        self.assertRaises(KeyError, cow.__delitem__, 'tags')
+        self.assertIsInstance(copy.deepcopy(cow), CowDict)
+        self.assertIsInstance(pickle.loads(pickle.dumps(cow)), CowDict)
+
+
+class TestCowDictSharing(unittest.TestCase):
+    """
+    Forking must only cost time in proportion to the changes made since the last fork
+    """
+
+    def test_unchanged_values_not_copied(self):
+        cow = CowDict({'big': {'counter': CopyCounter(1)}, 'small': 1})
+        CopyCounter.copies = 0
+        for _ in range(10):
+            cow_fork = cow.fork()
+            cow_fork['small'] = 2
+            cow['small'] += 1
+            self.assertEqual(cow_fork['big']['counter'], CopyCounter(1))
+        self.assertEqual(CopyCounter.copies, 10)  # Once per fork reading it, never for the source
+
+    def test_read_value_copied_once_per_fork(self):
+        cow = CowDict({'counter': CopyCounter(1)})
+        counter = cow['counter']
+        CopyCounter.copies = 0
+        for _ in range(3):
+            cow.fork()
+            self.assertIs(cow['counter'], counter)
+        self.assertEqual(CopyCounter.copies, 3)  # Snapshots of the value that may have changed in place
+
+
+class TestJobManagerClone(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.jobs_root, ignore_errors=True)
+
+    def test_clone_matches_deepcopy(self):
+        job_mgr = JobManager(self.jobs_root)
+        job_id, _ = job_mgr.create_job(job_data={'model': {'id': 'M1', 'params': {'a': [1, 2]}}})
+        values = job_mgr.get_job_data(job_id)['model']['params']['a']
+        clone_id, _ = job_mgr.clone_job(job_id)
+        values.append(3)
+        self.assertEqual(job_mgr.get_job_data(clone_id)['model']['params']['a'], [1, 2])
+        self.assertEqual(job_mgr.get_job_data(job_id)['model']['params']['a'], [1, 2, 3])
+        job_mgr.get_job_data(clone_id)['model']['id'] = 'M2'
+        self.assertEqual(job_mgr.get_job_data(job_id)['model']['id'], 'M1')
+        job_mgr.close()
+
+
+if __name__ == '__main__':
+    unittest.main()